@@ -0,0 +1,321 @@
+"""
+Benchmark driver: starts the stub services (`bench/stubs.py`) and the server pointed at them, drives the
+MCP endpoints with concurrent clients and reports latency percentiles, throughput, CPU and memory per tool.
+
+Example: `python bench/run.py --concurrency 16 --requests 200 --output bench_output.txt`
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+import httpx
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(BENCH_DIR), "src")
+TOOLS = ("search_web", "print_page", "print_pages", "search_process_pages")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values: list[float], share: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(share * (len(values) - 1))))]
+
+
+class ProcessSampler:
+    """
+    Samples the CPU time and resident memory of a process while a benchmark phase runs.
+    Uses psutil when installed and /proc otherwise (Linux only), reports nothing when neither is available.
+    """
+    def __init__(self, pid: int, interval: float = 0.1):
+        self.pid = pid
+        self.interval = interval
+        self.peak_rss = 0
+        self.task = None
+        self.process = psutil.Process(pid) if PSUTIL_AVAILABLE else None
+
+    def cpu_seconds(self) -> float|None:
+        if self.process:
+            times = self.process.cpu_times()
+            return times.user + times.system
+        try:
+            with open(f"/proc/{self.pid}/stat") as stat:
+                fields = stat.read().rsplit(")", 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        except (OSError, ValueError):
+            return None
+
+    def rss_bytes(self) -> int|None:
+        if self.process:
+            return self.process.memory_info().rss
+        try:
+            with open(f"/proc/{self.pid}/status") as status:
+                for line in status:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError):
+            return None
+        return None
+
+    async def _sample(self):
+        while True:
+            self.peak_rss = max(self.peak_rss, self.rss_bytes() or 0)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self.peak_rss = self.rss_bytes() or 0
+        self.started_cpu = self.cpu_seconds()
+        self.task = asyncio.create_task(self._sample())
+
+    async def stop(self) -> dict:
+        self.task.cancel()
+        cpu = self.cpu_seconds()
+        return {
+            "cpu_seconds": cpu - self.started_cpu if cpu is not None and self.started_cpu is not None else None,
+            "peak_rss_mb": self.peak_rss / 1024 / 1024 if self.peak_rss else None,
+        }
+
+
+class SseClient:
+    """
+    A client of the legacy HTTP+SSE transport: one open stream, tool calls POSTed one at a time.
+    """
+    def __init__(self, http: httpx.AsyncClient, base_url: str):
+        self.http = http
+        self.base_url = base_url
+        self.next_id = 0
+
+    async def __aenter__(self):
+        self.stream = self.http.stream("GET", f"{self.base_url}/sse", timeout=None)
+        response = await self.stream.__aenter__()
+        self.lines = response.aiter_lines()
+        async for line in self.lines:
+            if line.startswith("data:") and "messages" in line:
+                endpoint = line[5:].strip()
+                self.messages_url = self.base_url + "/messages" + endpoint.split("/messages", 1)[1]
+                return self
+        raise RuntimeError("The server didn't announce a messages endpoint")
+
+    async def __aexit__(self, *exc_info):
+        await self.stream.__aexit__(*exc_info)
+
+    async def call(self, name: str, arguments: dict) -> dict:
+        self.next_id += 1
+        request = {"jsonrpc": "2.0", "id": self.next_id, "method": "tools/call", "params": {"name": name, "arguments": arguments}}
+        response = await self.http.post(self.messages_url, json=request)
+        response.raise_for_status()
+        async for line in self.lines:
+            if not line.startswith("data:"):
+                continue
+            try:
+                message = json.loads(line[5:])
+            except json.JSONDecodeError:
+                continue
+            if message.get("id") == self.next_id:
+                return message
+        raise RuntimeError("The stream ended before the result")
+
+
+class StreamableClient:
+    """
+    A client of the Streamable HTTP transport: every tool call is a single POST to `/mcp`.
+    """
+    def __init__(self, http: httpx.AsyncClient, base_url: str):
+        self.http = http
+        self.url = f"{base_url}/mcp"
+        self.next_id = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def call(self, name: str, arguments: dict) -> dict:
+        self.next_id += 1
+        request = {"jsonrpc": "2.0", "id": self.next_id, "method": "tools/call", "params": {"name": name, "arguments": arguments}}
+        headers = {"Accept": "application/json, text/event-stream"}
+        async with self.http.stream("POST", self.url, json=request, headers=headers, timeout=None) as response:
+            response.raise_for_status()
+            if not response.headers.get("content-type", "").startswith("text/event-stream"):
+                return json.loads(await response.aread())
+            async for line in response.aiter_lines():
+                if line.startswith("data:"):
+                    message = json.loads(line[5:])
+                    if message.get("id") == self.next_id:
+                        return message
+        raise RuntimeError("The stream ended before the result")
+
+
+def tool_arguments(tool: str, index: int, distinct: int, pages_url: str) -> dict:
+    key = index % distinct
+    if tool == "search_web":
+        return {"query": f"bench query {key}"}
+    if tool == "print_page":
+        return {"url": f"{pages_url}/page-{key}"}
+    if tool == "print_pages":
+        return {"urls": [f"{pages_url}/pages-{key}-{i}" for i in range(5)]}
+    return {"query": f"bench research {key}", "context": "search engine latency and throughput"}
+
+
+async def run_tool(tool: str, args, base_url: str, pages_url: str, server_pid: int) -> dict:
+    latencies, errors = [], 0
+    counter = iter(range(args.requests))
+    client_class = StreamableClient if args.transport == "streamable" else SseClient
+    limits = httpx.Limits(max_connections=args.concurrency * 2 + 4)
+
+    async def worker(http: httpx.AsyncClient):
+        nonlocal errors
+        async with client_class(http, base_url) as client:
+            for index in counter:
+                started = time.perf_counter()
+                try:
+                    message = await client.call(tool, tool_arguments(tool, index, args.distinct, pages_url))
+                    if "error" in message:
+                        errors += 1
+                except Exception as e:
+                    print(f"{tool} call failed: {e}", file=sys.stderr)
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+    sampler = ProcessSampler(server_pid)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as http:
+        sampler.start()
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(http) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+    usage = await sampler.stop()
+
+    return {
+        "tool": tool,
+        "requests": len(latencies),
+        "errors": errors,
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        **usage,
+    }
+
+
+def format_report(results: list[dict], args) -> str:
+    header = f"{'tool':<22}{'requests':>9}{'errors':>8}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}{'req/s':>9}{'cpu s':>9}{'rss MB':>9}"
+    lines = [
+        f"transport={args.transport} concurrency={args.concurrency} requests={args.requests} distinct={args.distinct} "
+        f"page_bytes={args.page_bytes} page_latency={args.page_latency} llm_latency={args.llm_latency} "
+        f"direct_fail_rate={args.direct_fail_rate} llm_rate_limit_rate={args.llm_rate_limit_rate}",
+        header,
+        "-" * len(header),
+    ]
+    for result in results:
+        cpu = f"{result['cpu_seconds']:.2f}" if result["cpu_seconds"] is not None else "-"
+        rss = f"{result['peak_rss_mb']:.1f}" if result["peak_rss_mb"] is not None else "-"
+        lines.append(
+            f"{result['tool']:<22}{result['requests']:>9}{result['errors']:>8}{result['p50']:>9.3f}{result['p95']:>9.3f}"
+            f"{result['p99']:>9.3f}{result['throughput']:>9.1f}{cpu:>9}{rss:>9}"
+        )
+    return "\n".join(lines) + "\n"
+
+
+async def wait_ready(url: str, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as http:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"{url} process exited with code {process.returncode}")
+            try:
+                await http.get(url)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} didn't start in {timeout} seconds")
+
+
+async def main(args):
+    stub_port, server_port = free_port(), free_port()
+    stub_url = f"http://127.0.0.1:{stub_port}"
+    base_url = f"http://127.0.0.1:{server_port}"
+
+    stub_process = subprocess.Popen([
+        sys.executable, os.path.join(BENCH_DIR, "stubs.py"), "--port", str(stub_port),
+        "--page-bytes", str(args.page_bytes), "--page-latency", str(args.page_latency),
+        "--brave-latency", str(args.brave_latency), "--proxy-latency", str(args.proxy_latency),
+        "--llm-latency", str(args.llm_latency), "--direct-fail-rate", str(args.direct_fail_rate),
+        "--llm-rate-limit-rate", str(args.llm_rate_limit_rate),
+    ])
+    server_env = {
+        **os.environ,
+        "PORT": str(server_port),
+        "BRAVE_API_KEY": "bench",
+        "BRAVE_API_URL": f"{stub_url}/res/v1/web/search",
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_API_URL": f"{stub_url}/v1",
+        "OPENAI_MODEL_NAME": "bench",
+        "PROXY": f"{stub_url}/proxy",
+    }
+    server_process = subprocess.Popen([sys.executable, "main.py"], cwd=SRC_DIR, env=server_env,
+                                      stdout=None if args.verbose else subprocess.DEVNULL,
+                                      stderr=None if args.verbose else subprocess.DEVNULL)
+    try:
+        await wait_ready(f"{stub_url}/docs", stub_process)
+        await wait_ready(f"{base_url}/metrics", server_process)
+        
+        results = []
+        for tool in args.tools.split(","):
+            if tool not in TOOLS:
+                raise SystemExit(f"Unknown tool {tool}, expected some of: {', '.join(TOOLS)}")
+            results.append(await run_tool(tool, args, base_url, f"{stub_url}/pages", server_process.pid))
+            print(f"{tool} done", file=sys.stderr)
+    finally:
+        server_process.terminate()
+        stub_process.terminate()
+        server_process.wait()
+        stub_process.wait()
+
+    report = format_report(results, args)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(report)
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the MCP server against local stub services.")
+    parser.add_argument("--tools", default=",".join(TOOLS), help="comma separated tools to benchmark, in order")
+    parser.add_argument("--transport", choices=("sse", "streamable"), default="sse")
+    parser.add_argument("--concurrency", type=int, default=8, help="number of simultaneous clients")
+    parser.add_argument("--requests", type=int, default=100, help="calls per tool")
+    parser.add_argument("--distinct", type=int, default=1_000_000,
+                        help="number of distinct queries and URLs, lower it to measure cache hits")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds before a call counts as failed")
+    parser.add_argument("--page-bytes", type=int, default=50000)
+    parser.add_argument("--page-latency", type=float, default=0.05)
+    parser.add_argument("--brave-latency", type=float, default=0.1)
+    parser.add_argument("--proxy-latency", type=float, default=0.1)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--direct-fail-rate", type=float, default=0.0)
+    parser.add_argument("--llm-rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--output", help="also write the report to this file")
+    parser.add_argument("--json", help="write the raw results as JSON to this file, to compare releases")
+    parser.add_argument("--verbose", action="store_true", help="show the server output")
+    asyncio.run(main(parser.parse_args()))
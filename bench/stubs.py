@@ -0,0 +1,204 @@
+"""
+Local stand-ins for the services the server talks to, so benchmarks run offline and reproducibly:
+
+- `GET /res/v1/web/search` - Brave web search, results point at the generated pages
+- `GET /pages/{page_id}` - generated HTML pages of configurable size and latency
+- `GET /proxy?url=` - the fetch proxy, loads the URL itself
+- `POST /v1/chat/completions` - OpenAI-compatible chat endpoint selecting a block of lines, with streaming
+
+Run with `python bench/stubs.py --port 5100`, see `--help` for the size, latency and failure settings.
+"""
+import re
+import json
+import random
+import asyncio
+import hashlib
+import argparse
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
+
+
+WORDS = """
+search engine result page cache proxy latency throughput request response server client network protocol
+document markdown heading paragraph section article content context model token window range query index
+""".split()
+
+PROXY_HEADER = "X-Bench-Proxy"
+
+
+class StubConfig:
+    def __init__(self, page_bytes: int = 50000, page_latency: float = 0.05, brave_latency: float = 0.1,
+                 proxy_latency: float = 0.1, llm_latency: float = 0.5, direct_fail_rate: float = 0.0,
+                 results: int = 10, llm_rate_limit_rate: float = 0.0):
+        """
+        Args:
+            page_bytes: Approximate size of the generated pages.
+            page_latency: Seconds before a page is served.
+            brave_latency: Seconds before search results are served.
+            proxy_latency: Seconds the proxy adds on top of the page latency.
+            llm_latency: Seconds before a chat completion is answered (spread over the chunks when streaming).
+            direct_fail_rate: Share of pages refusing direct requests with `403`, they load through the proxy.
+            results: Number of search results returned at most.
+            llm_rate_limit_rate: Share of chat completions refused with `429 Too Many Requests`.
+        """
+        self.page_bytes = page_bytes
+        self.page_latency = page_latency
+        self.brave_latency = brave_latency
+        self.proxy_latency = proxy_latency
+        self.llm_latency = llm_latency
+        self.direct_fail_rate = direct_fail_rate
+        self.results = results
+        self.llm_rate_limit_rate = llm_rate_limit_rate
+
+
+def _seed(text: str) -> int:
+    return int(hashlib.sha256(text.encode()).hexdigest()[:16], 16)
+
+
+def generate_page(page_id: str, size: int) -> str:
+    """
+    Returns a deterministic HTML page with navigation, sections of text and a footer, of about `size` bytes.
+    """
+    rng = random.Random(_seed(page_id))
+    parts = [
+        f"<html><head><title>Page {page_id}</title><script>var tracking = {rng.random()};</script></head><body>",
+        '<nav class="menu"><a href="/">Home</a> <a href="/about">About</a> <a href="/contact">Contact</a></nav>',
+        f"<article><h1>Page {page_id}</h1>",
+    ]
+    length = sum(len(part) for part in parts)
+    section = 0
+    while length < size:
+        section += 1
+        block = f"<h2>Section {section}</h2>" + "".join(
+            "<p>" + " ".join(rng.choice(WORDS) for _ in range(rng.randint(30, 80))) + ".</p>"
+            for _ in range(rng.randint(2, 5))
+        )
+        parts.append(block)
+        length += len(block)
+    parts.append('</article><footer class="footer">Copyright, cookie consent and newsletter signup</footer></body></html>')
+    return "".join(parts)
+
+
+def create_app(config: StubConfig) -> FastAPI:
+    app = FastAPI()
+    client = httpx.AsyncClient(timeout=60)
+    app.router.add_event_handler("shutdown", client.aclose)
+
+    @app.get("/res/v1/web/search")
+    async def brave_search(request: Request, q: str, count: int = 10):
+        await asyncio.sleep(config.brave_latency)
+        base_url = str(request.base_url).rstrip("/")
+        page_prefix = hashlib.sha256(q.encode()).hexdigest()[:12]
+        results = [
+            {
+                "title": f"Result {i} for {q}",
+                "url": f"{base_url}/pages/{page_prefix}-{i}",
+                "description": f"Generated page {i} matching {q}.",
+            }
+            for i in range(min(count, config.results))
+        ]
+        return JSONResponse({"web": {"results": results}})
+
+    @app.get("/pages/{page_id}")
+    async def page(request: Request, page_id: str):
+        await asyncio.sleep(config.page_latency)
+        if not request.headers.get(PROXY_HEADER) and random.Random(_seed(page_id)).random() < config.direct_fail_rate:
+            return Response("Forbidden", status_code=403)
+        return HTMLResponse(generate_page(page_id, config.page_bytes))
+
+    @app.get("/proxy")
+    async def proxy(url: str):
+        await asyncio.sleep(config.proxy_latency)
+        response = await client.get(url, headers={PROXY_HEADER: "1"})
+        return Response(response.content, status_code=response.status_code,
+                        media_type=response.headers.get("content-type"))
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        if random.random() < config.llm_rate_limit_rate:
+            error = {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}
+            return JSONResponse(error, status_code=429, headers={"Retry-After": "0.2"})
+        body = await request.json()
+        prompt = "\n".join(message.get("content") or "" for message in body.get("messages", []))
+        # Select the first dozen numbered lines of the window the prompt holds
+        line_numbers = [int(number) for number in re.findall(r"^(\d+) \| ", prompt, re.MULTILINE)]
+        if line_numbers:
+            answer = f"START: {line_numbers[0]}, END: {min(line_numbers[0] + 12, line_numbers[-1])}"
+        else:
+            answer = "START: 0, END: 0"
+        usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(answer) // 4,
+                 "total_tokens": (len(prompt) + len(answer)) // 4}
+        completion_id = f"chatcmpl-{_seed(prompt) % 10**12}"
+        model = body.get("model", "bench")
+        
+        if not body.get("stream"):
+            await asyncio.sleep(config.llm_latency)
+            return JSONResponse({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": 0,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+        async def chunks():
+            pieces = re.findall(r".{1,6}", answer)
+            for piece in pieces:
+                await asyncio.sleep(config.llm_latency / len(pieces))
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": 0,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            final = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": 0,
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            }
+            if (body.get("stream_options") or {}).get("include_usage"):
+                final["usage"] = usage
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+        
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub Brave, website, proxy and OpenAI servers for benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5100)
+    parser.add_argument("--page-bytes", type=int, default=50000, help="approximate size of the pages")
+    parser.add_argument("--page-latency", type=float, default=0.05, help="seconds before a page is served")
+    parser.add_argument("--brave-latency", type=float, default=0.1, help="seconds before search results are served")
+    parser.add_argument("--proxy-latency", type=float, default=0.1, help="seconds the proxy adds")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds before a completion is answered")
+    parser.add_argument("--direct-fail-rate", type=float, default=0.0, help="share of pages only loading through the proxy")
+    parser.add_argument("--results", type=int, default=10, help="search results returned at most")
+    parser.add_argument("--llm-rate-limit-rate", type=float, default=0.0, help="share of completions refused with 429")
+    args = parser.parse_args()
+
+    config = StubConfig(
+        page_bytes=args.page_bytes,
+        page_latency=args.page_latency,
+        brave_latency=args.brave_latency,
+        proxy_latency=args.proxy_latency,
+        llm_latency=args.llm_latency,
+        direct_fail_rate=args.direct_fail_rate,
+        results=args.results,
+        llm_rate_limit_rate=args.llm_rate_limit_rate,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,48 @@
-import requests
+from http_client import HttpClient, get_default_client
+from search_cache import SearchCache
+from metrics import stage
 
 
 class BraveApi:
 
-    def __init__(self, api_key: str):
+    MAX_COUNT = 20
+    API_ENDPOINT = "https://api.search.brave.com/res/v1/web/search"
+
+    def __init__(self, api_key: str, http_client: HttpClient|None = None, cache: SearchCache|None = None,
+                 api_endpoint: str|None = None):
         if not api_key:
             raise ValueError("API key must be provided during BraveApi initialization.")
         self.api_key = api_key
-        self.api_endpoint = "https://api.search.brave.com/res/v1/web/search"
+        self.api_endpoint = api_endpoint or self.API_ENDPOINT
+        self.http_client = http_client or get_default_client()
+        self.cache = cache
 
 
-    def search(self, query: str, count: int = 10) -> list[dict[str, str]] | None:
+    async def search(self, query: str, count: int = 10, country: str|None = None, search_lang: str|None = None) -> list[dict[str, str]] | None:
         if not query: return None
         
+        if self.cache:
+            return await self.cache.get_or_fetch(
+                query, count, (country, search_lang),
+                lambda fetch_count: self._search(query, fetch_count, country, search_lang)
+            )
+        return await self._search(query, count, country, search_lang)
+
+
+    async def _search(self, query: str, count: int, country: str|None, search_lang: str|None) -> list[dict[str, str]] | None:
         headers = {
             "Accept": "application/json",
             "Accept-Encoding": "gzip",
             "X-Subscription-Token": self.api_key,
         }
-        params = {"q": query, "count": count}
+        params = {"q": query, "count": min(count, self.MAX_COUNT)}
+        if country: params["country"] = country
+        if search_lang: params["search_lang"] = search_lang
         
         try:
-            response = requests.get(self.api_endpoint, params=params, headers=headers)
-            response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
+            with stage("brave"):
+                response = await self.http_client.get(self.api_endpoint, params=params, headers=headers)
+                response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
             search_results_json = response.json()
             
             results_list = []
@@ -0,0 +1,129 @@
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory LRU mapping, bounded by the total size of its values.
+    """
+    def __init__(self, max_size: int, sizeof=None, ttl: float|None = None):
+        """
+        Args:
+            max_size: Upper bound of the summed sizes of all values.
+            sizeof: Function returning the size of a value, defaults to 1 per entry.
+            ttl: Optional number of seconds after which entries expire.
+        """
+        self.max_size = max_size
+        self.sizeof = sizeof or (lambda value: 1)
+        self.ttl = ttl
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None:
+                return default
+            value, size, expires_at = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._remove(key)
+                return default
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float|None = None):
+        size = self.sizeof(value)
+        ttl = ttl if ttl is not None else self.ttl
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            if size > self.max_size:
+                return
+            self.entries[key] = (value, size, time.monotonic() + ttl if ttl is not None else None)
+            self.size += size
+            while self.size > self.max_size:
+                self._remove(next(iter(self.entries)))
+
+    def pop(self, key, default=None):
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None:
+                return default
+            self._remove(key)
+            return item[0]
+
+    def _remove(self, key):
+        _, size, _ = self.entries.pop(key)
+        self.size -= size
+
+    def __contains__(self, key) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+class SqliteStore:
+    """
+    Persistent key/value tier stored in SQLite, bounded by the total size of its values.
+    Values are stored as JSON and evicted least-recently-used first.
+    """
+    def __init__(self, path: str, max_size: int, table: str = "entries"):
+        """
+        Args:
+            path: Path of the database file.
+            max_size: Upper bound of the summed sizes of all values in bytes of JSON.
+            table: Table name, so several stores can share one database file.
+        """
+        self.max_size = max_size
+        self.table = table
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT, size INTEGER, accessed_at REAL)"
+            )
+            self.connection.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed_at ON {table} (accessed_at)")
+            self.size = self.connection.execute(f"SELECT COALESCE(SUM(size), 0) FROM {table}").fetchone()[0]
+
+    def get(self, key: str, default=None):
+        with self.lock, self.connection:
+            row = self.connection.execute(f"SELECT value FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return default
+            self.connection.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            return json.loads(row[0])
+
+    def set(self, key: str, value):
+        data = json.dumps(value)
+        with self.lock, self.connection:
+            self._delete(key)
+            self.connection.execute(
+                f"INSERT INTO {self.table} (key, value, size, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, data, len(data), time.time())
+            )
+            self.size += len(data)
+            while self.size > self.max_size:
+                row = self.connection.execute(f"SELECT key FROM {self.table} ORDER BY accessed_at LIMIT 1").fetchone()
+                if row is None:
+                    break
+                self._delete(row[0])
+
+    def delete(self, key: str):
+        with self.lock, self.connection:
+            self._delete(key)
+
+    def _delete(self, key: str):
+        row = self.connection.execute(f"SELECT size FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self.connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self.size -= row[0]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,220 @@
+import io
+import re
+from bs4 import BeautifulSoup, Comment
+from markdownify import MarkdownConverter
+
+try:
+    import lxml  # noqa: F401
+    PARSER = "lxml"
+except ImportError:
+    PARSER = "html.parser"
+
+try:
+    from pypdf import PdfReader
+    PDF_AVAILABLE = True
+except ImportError:
+    PDF_AVAILABLE = False
+
+
+MODES = ("full", "clean", "article")
+
+HTML_TYPES = {"text/html", "application/xhtml+xml"}
+TEXT_TYPES = {"text/plain", "text/markdown", "text/x-markdown", "text/csv", "text/xml", "application/xml"}
+JSON_TYPES = {"application/json", "application/ld+json"}
+PDF_TYPE = "application/pdf"
+
+NON_CONTENT_TAGS = [
+    "script", "style", "noscript", "template", "svg", "canvas", "iframe", "object", "embed",
+    "button", "input", "select", "textarea", "nav", "aside", "footer", "dialog",
+]
+NEGATIVE_PATTERN = re.compile(
+    r"nav|menu|footer|sidebar|cookie|consent|gdpr|banner|advert|\bads?\b|sponsor|promo|share|social|"
+    r"comment|related|recommend|breadcrumb|popup|modal|newsletter|subscribe|signup|masthead|skip",
+    re.IGNORECASE
+)
+POSITIVE_PATTERN = re.compile(r"article|content|main|post|entry|body|text|story|blog|docs?", re.IGNORECASE)
+BLOCK_TAGS = ["p", "pre", "td", "blockquote", "li", "dd", "h2", "h3", "h4"]
+MIN_ARTICLE_TEXT = 250
+
+
+def _class_weight(tag) -> int:
+    weight = 0
+    for value in (" ".join(tag.get("class") or []), tag.get("id") or "", tag.get("role") or ""):
+        if not value:
+            continue
+        if NEGATIVE_PATTERN.search(value):
+            weight -= 25
+        if POSITIVE_PATTERN.search(value):
+            weight += 25
+    return weight
+
+
+def _link_density(tag) -> float:
+    text_length = len(tag.get_text(" ", strip=True))
+    if not text_length:
+        return 1.0
+    link_length = sum(len(link.get_text(" ", strip=True)) for link in tag.find_all("a"))
+    return link_length / text_length
+
+
+def _best_block(soup: BeautifulSoup):
+    """
+    Scores the parents of text blocks by text density and returns the best one, or None when no block has text.
+    """
+    scores = {}
+    for block in soup.find_all(BLOCK_TAGS):
+        text = block.get_text(" ", strip=True)
+        if len(text) < 25:
+            continue
+        score = 1 + text.count(",") + min(len(text) // 100, 3)
+        parent = block.parent
+        for divider, ancestor in ((1, parent), (2, parent.parent if parent else None)):
+            if ancestor is None or ancestor.name in (None, "[document]"):
+                continue
+            if id(ancestor) not in scores:
+                scores[id(ancestor)] = [ancestor, _class_weight(ancestor)]
+            scores[id(ancestor)][1] += score / divider
+
+    best, best_score = None, 0
+    for ancestor, score in scores.values():
+        score *= 1 - _link_density(ancestor)
+        if score > best_score:
+            best, best_score = ancestor, score
+    return best
+
+
+def strip_boilerplate(soup: BeautifulSoup) -> BeautifulSoup:
+    """
+    Removes subtrees that never hold page content: scripts, styles, form controls, navigation,
+    and elements whose class/id/role marks them as menus, banners, footers and similar.
+    Forms are only removed when small or mostly links, some sites (e.g. ASP.NET WebForms) wrap the whole page in one.
+    Elements holding the best scoring content block are kept, whatever their class or links (e.g. a sidebar layout
+    wrapping a long table of contents and the article).
+    """
+    for comment in soup.find_all(string=lambda text: isinstance(text, Comment)):
+        comment.extract()
+    for tag in soup.find_all(NON_CONTENT_TAGS):
+        tag.decompose()
+    for tag in soup.find_all(attrs={"aria-hidden": "true"}):
+        tag.decompose()
+    for form in soup.find_all("form"):
+        if not form.decomposed and (len(form.get_text(" ", strip=True)) < MIN_ARTICLE_TEXT or _link_density(form) > 0.5):
+            form.decompose()
+    best = _best_block(soup)
+    protected = {id(best)} | {id(parent) for parent in best.parents} if best else set()
+    for tag in soup.find_all(True):
+        if tag.decomposed or tag.name in ("html", "body", "main", "article") or id(tag) in protected:
+            continue
+        if tag.name == "header" and not tag.find_parent(["article", "main"]):
+            tag.decompose()
+        elif _class_weight(tag) < 0 and _link_density(tag) > 0.3 or tag.get("role") in ("navigation", "banner", "contentinfo"):
+            tag.decompose()
+    return soup
+
+
+def find_main_content(soup: BeautifulSoup):
+    """
+    Returns the element most likely holding the main article, or None when no block has enough text.
+    A page with one `<article>` (or one holding most of the text) returns it, pages with several (threads,
+    forums, listings with one `<article>` per post) return their common parent, others are scored by text density.
+    """
+    articles = [article for article in soup.find_all("article") if not article.find_parent("article")]
+    lengths = [len(article.get_text(" ", strip=True)) for article in articles]
+    if articles and sum(lengths) >= MIN_ARTICLE_TEXT:
+        longest = max(range(len(articles)), key=lengths.__getitem__)
+        if lengths[longest] >= MIN_ARTICLE_TEXT and lengths[longest] * 3 >= sum(lengths) * 2:
+            return articles[longest]
+        parent_ids = [{id(parent) for parent in article.parents} for article in articles[1:]]
+        return next(parent for parent in articles[0].parents if all(id(parent) in ids for ids in parent_ids))
+
+    best = _best_block(soup)
+    if best is None or len(best.get_text(" ", strip=True)) < MIN_ARTICLE_TEXT:
+        return None
+    return best
+
+
+def html_to_markdown(html: str, mode: str = "full") -> str:
+    """
+    Converts HTML to markdown, parsing the document only once (twice when falling back to `full`).
+
+    Args:
+        html: The HTML document.
+        mode: `full` converts the whole document, `clean` drops non-content subtrees first,
+              `article` additionally keeps only the main content block (falling back to `clean`).
+              Near-empty `clean` and `article` results fall back to `full`.
+
+    Returns:
+        The markdown content.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode '{mode}', expected one of: {', '.join(MODES)}")
+
+    soup = BeautifulSoup(html, PARSER)
+    if mode != "full":
+        strip_boilerplate(soup)
+    if mode == "article":
+        soup = find_main_content(soup) or soup
+
+    markdown = re.sub(r"\n{3,}", "\n\n", MarkdownConverter().convert_soup(soup)).strip()
+    if mode != "full" and len(markdown) < MIN_ARTICLE_TEXT:
+        # The extraction may have dropped the content, keep whatever the whole page has instead
+        full_markdown = html_to_markdown(html, "full")
+        if len(full_markdown) > len(markdown):
+            return full_markdown
+    return markdown
+
+
+def is_supported(content_type: str, content_length: int|None, max_bytes: int|None = None) -> bool:
+    """
+    Decides from the response headers whether a document is worth downloading.
+    Unknown types are only accepted when the server doesn't send a content type at all.
+    PDFs need the complete file, so they are rejected when larger than `max_bytes`.
+    """
+    if not content_type or content_type in HTML_TYPES or content_type in TEXT_TYPES or content_type in JSON_TYPES:
+        return True
+    if content_type.endswith(("+xml", "+json")):
+        return True
+    if content_type == PDF_TYPE:
+        return PDF_AVAILABLE and (max_bytes is None or content_length is None or content_length <= max_bytes)
+    return False
+
+
+def pdf_to_markdown(content: bytes) -> str:
+    reader = PdfReader(io.BytesIO(content))
+    return "\n\n".join(page.extract_text() or "" for page in reader.pages).strip()
+
+
+def document_to_markdown(content: bytes, content_type: str, encoding: str|None = None, mode: str = "full",
+                         truncated: bool = False) -> str:
+    """
+    Converts a downloaded document to markdown with the extractor matching its content type.
+
+    Args:
+        content: The (possibly truncated) response body.
+        content_type: Media type of the response, HTML is assumed when empty.
+        encoding: Text encoding from the response headers, UTF-8 when unknown.
+        mode: Extraction mode for HTML, see `html_to_markdown`.
+        truncated: Whether the body was cut at the download size cap.
+
+    Returns:
+        The markdown content.
+
+    Raises:
+        ValueError: When the content can't be converted.
+    """
+    if content_type == PDF_TYPE:
+        if truncated:
+            raise ValueError("PDF document exceeds the download size limit")
+        markdown = pdf_to_markdown(content)
+    else:
+        text = content.decode(encoding or "utf-8", errors="replace")
+        if content_type in JSON_TYPES or content_type.endswith("+json"):
+            markdown = f"```json\n{text}\n```"
+        elif content_type in TEXT_TYPES or content_type.endswith("+xml"):
+            markdown = text
+        else:
+            markdown = html_to_markdown(text, mode)
+
+    if truncated:
+        markdown += f"\n\n*[Content truncated at {len(content)} bytes]*"
+    return markdown
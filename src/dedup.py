@@ -0,0 +1,70 @@
+import re
+import heapq
+import hashlib
+from urllib.parse import urlsplit, parse_qsl, urlencode
+from ranking import tokenize
+
+
+TRACKING_PARAMS = frozenset("""
+fbclid gclid gclsrc dclid msclkid yclid igshid twclid mc_cid mc_eid _ga _gl _hsenc _hsmi ref ref_src ref_url cmpid ncid ito
+""".split())
+TRACKING_PREFIXES = ("utm_", "hsa_", "pk_", "mtm_", "vero_")
+HOST_PREFIXES = ("www.", "m.", "mobile.", "amp.")
+AMP_CACHE_PATTERN = re.compile(r"^/[cvi]/(?:s/)?([^/]+)(/.*)?$")
+AMP_PATH_PATTERN = re.compile(r"/amp/?$|\.amp(?=\.html?$)")
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    Returns an identity key of the document a URL points at, so variants of one page compare equal:
+    no scheme (http and https), no `www.`, mobile or AMP host prefixes, AMP cache and AMP path variants
+    resolved, tracking parameters dropped, remaining query parameters sorted, no trailing slash or fragment.
+    The key is only used for comparison, pages are still fetched from the original URL.
+    """
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    path = parts.path
+
+    if host.endswith(".cdn.ampproject.org"):
+        match = AMP_CACHE_PATTERN.match(path)
+        if match:
+            host, path = match.group(1).lower(), match.group(2) or "/"
+    for prefix in HOST_PREFIXES:
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+            break
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+
+    path = AMP_PATH_PATTERN.sub("", path).rstrip("/")
+    query = urlencode(sorted(
+        (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if name.lower() not in TRACKING_PARAMS and not name.lower().startswith(TRACKING_PREFIXES)
+        and not (name.lower() == "amp" or (name.lower() in ("output", "outputtype") and value.lower() == "amp"))
+    ))
+    return host + path + (f"?{query}" if query else "")
+
+
+def _hash(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "big")
+
+
+def fingerprint(text: str, size: int = 128, shingle_size: int = 5) -> frozenset[int]:
+    """
+    Bottom-k MinHash sketch of a text: the `size` smallest hashes of its word shingles.
+    Texts sharing most of their shingles (copies with different boilerplate or small edits) share most of their sketch.
+    """
+    tokens = tokenize(text)
+    shingles = {" ".join(tokens[i:i + shingle_size]) for i in range(max(len(tokens) - shingle_size + 1, 1))}
+    return frozenset(heapq.nsmallest(size, map(_hash, shingles)))
+
+
+def similarity(first: frozenset[int], second: frozenset[int], size: int = 128) -> float:
+    """
+    Returns:
+        Estimated Jaccard similarity of the shingles of two texts, from their `fingerprint` sketches.
+    """
+    if not first or not second:
+        return 0.0
+    union = heapq.nsmallest(size, first | second)
+    return sum(1 for value in union if value in first and value in second) / len(union)
@@ -0,0 +1,76 @@
+import re
+import hashlib
+from cache import LRUCache
+from page_cache import PageCache
+from markdown_sections import split_sections, SETEXT_UNDERLINE
+
+
+ATX_LEVEL = re.compile(r"^\s{0,3}(#{1,6})\s+(.*?)[\s#]*$")
+
+
+def outline(markdown: str) -> list[dict]:
+    """
+    Returns:
+        The headings of a markdown document as `{"title", "level", "start", "end"}`, where `start`/`end` are the
+        character offsets of the section, which runs until the next heading of the same or a higher level.
+    """
+    lines = markdown.split("\n")
+    offsets = [0]
+    for line in lines:
+        offsets.append(offsets[-1] + len(line) + 1)
+    headings = []
+    for start, _ in split_sections(lines):
+        match = ATX_LEVEL.match(lines[start])
+        if match:
+            level, title = len(match.group(1)), match.group(2)
+        elif start + 1 < len(lines) and SETEXT_UNDERLINE.match(lines[start + 1]):
+            level, title = 1 if lines[start + 1].strip()[0] == "=" else 2, lines[start].strip()
+        else:
+            continue
+        headings.append({"title": title, "level": level, "start": offsets[start], "end": len(markdown)})
+    for i, heading in enumerate(headings):
+        following = next((other for other in headings[i + 1:] if other["level"] <= heading["level"]), None)
+        if following:
+            heading["end"] = following["start"]
+    return headings
+
+
+class DocumentStore:
+    """
+    Bounded in-memory store of converted pages, so `print_page` serves a large page in chunks
+    without refetching or reconverting it. Documents are keyed by URL, mode and content version
+    (a hash of the markdown); cursors name the version they were issued for.
+    """
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: float = 1800):
+        """
+        Args:
+            max_bytes: Upper bound of the summed size of the stored documents, least recently used ones are evicted.
+            ttl: Seconds a document is kept.
+        """
+        self.documents = LRUCache(max_bytes, sizeof=lambda document: len(document["markdown"]), ttl=ttl)
+        self.latest = LRUCache(max(max_bytes // 1024, 1), ttl=ttl)
+
+    @staticmethod
+    def version(markdown: str) -> str:
+        return hashlib.sha256(markdown.encode("utf-8", "surrogatepass")).hexdigest()[:12]
+
+    def get(self, url: str, mode: str, version: str|None = None) -> dict|None:
+        """
+        Args:
+            version: The version to return, None for the latest stored one.
+
+        Returns:
+            The document as `{"markdown", "version", "headings"}`, or None when it isn't stored.
+        """
+        key = PageCache.key(url, mode)
+        version = version or self.latest.get(key)
+        if version is None:
+            return None
+        return self.documents.get(f"{key}@{version}")
+
+    def put(self, url: str, mode: str, markdown: str) -> dict:
+        key = PageCache.key(url, mode)
+        document = {"markdown": markdown, "version": self.version(markdown), "headings": outline(markdown)}
+        self.documents.set(f"{key}@{document['version']}", document)
+        self.latest.set(key, document["version"])
+        return document
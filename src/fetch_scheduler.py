@@ -0,0 +1,233 @@
+import time
+import asyncio
+import contextlib
+import contextvars
+from collections import OrderedDict, deque
+from urllib.parse import urlsplit
+from metrics import stage, FETCH_WAITING, FETCH_IN_FLIGHT
+
+
+class FetchLane:
+    """
+    Priority lanes of fetches, lower values are served first.
+    """
+    INTERACTIVE = 0
+    SEARCH = 1
+    BULK = 2
+    NAMES = ("interactive", "search", "bulk")
+
+
+class SharedLane:
+    """
+    Lane of work shared by several callers (e.g. a page load joined by a later `print_page`):
+    the highest priority lane of any of them. Raising it moves the work's queued requests to the new lane.
+    """
+    def __init__(self, lane: int):
+        self.lane = lane
+        # Queued requests of the work, with the scheduler and owner they wait in
+        self.queued = {}
+
+    def join(self, lane: int):
+        if lane >= self.lane:
+            return
+        self.lane = lane
+        for waiter, (scheduler, owner) in list(self.queued.items()):
+            scheduler.promote(waiter, owner, lane)
+
+
+# Lane and owner (the MCP session, for fairness) of the fetches made by the current task,
+# and the shared lane overriding the lane for work done on behalf of several callers
+fetch_lane = contextvars.ContextVar("fetch_lane", default=FetchLane.SEARCH)
+fetch_owner = contextvars.ContextVar("fetch_owner", default=None)
+shared_lane = contextvars.ContextVar("shared_lane", default=None)
+
+
+class HostState:
+    def __init__(self, burst: float):
+        self.active = 0
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+
+class FetchScheduler:
+    """
+    Admission control for outgoing requests, shared by the whole process.
+    Limits the requests in flight in total and per host, rate limits every host with a token bucket and
+    hands out free slots by lane priority, then round-robin between the owners (sessions) waiting in a lane,
+    so one session's bulk load can't starve the others. Waiters whose host is saturated don't block the rest.
+    """
+    def __init__(self, max_in_flight: int = 64, max_per_host: int = 6, host_rate: float|None = None,
+                 host_burst: float|None = None, host_limits: dict[str, int]|None = None):
+        """
+        Args:
+            max_in_flight: Upper bound of requests in flight across all hosts.
+            max_per_host: Upper bound of concurrent requests to a single host.
+            host_rate: Requests per second started per host, None for no rate limit.
+            host_burst: Requests a host may receive at once before the rate applies, defaults to `max_per_host`.
+            host_limits: Concurrency limits of specific hosts overriding `max_per_host`, e.g. for the proxy.
+        """
+        self.max_in_flight = max_in_flight
+        self.max_per_host = max_per_host
+        self.host_rate = host_rate
+        self.host_burst = host_burst or max_per_host
+        self.host_limits = {host.lower(): limit for host, limit in (host_limits or {}).items()}
+        self.in_flight = 0
+        self.hosts = {}
+        # Per lane, the owners with waiters in round-robin order, each with its FIFO of (host, future)
+        self.lanes = [OrderedDict() for _ in FetchLane.NAMES]
+        self.timer = None
+        self.pruned = time.monotonic()
+        FETCH_IN_FLIGHT.set_function(lambda: self.in_flight)
+
+    @staticmethod
+    def host_of(url: str) -> str:
+        return (urlsplit(url).hostname or "").lower()
+
+    def _host(self, host: str) -> HostState:
+        state = self.hosts.get(host)
+        if state is None:
+            state = self.hosts[host] = HostState(self.host_burst)
+        return state
+
+    def _refill(self, state: HostState, now: float):
+        if self.host_rate:
+            state.tokens = min(self.host_burst, state.tokens + (now - state.updated) * self.host_rate)
+        state.updated = now
+
+    def _admissible(self, host: str, now: float) -> bool:
+        state = self._host(host)
+        self._refill(state, now)
+        return (self.in_flight < self.max_in_flight
+                and state.active < self.host_limits.get(host, self.max_per_host)
+                and (not self.host_rate or state.tokens >= 1))
+
+    def _admit(self, host: str):
+        state = self._host(host)
+        state.active += 1
+        if self.host_rate:
+            state.tokens -= 1
+        self.in_flight += 1
+
+    def waiting(self, lane: int|None = None) -> int:
+        lanes = self.lanes if lane is None else [self.lanes[lane]]
+        return sum(len(waiters) for owners in lanes for waiters in owners.values())
+
+    def _update_gauges(self):
+        for lane, name in enumerate(FetchLane.NAMES):
+            FETCH_WAITING.set(self.waiting(lane), lane=name)
+
+    def _dispatch(self):
+        """
+        Hands free slots to waiters: highest priority lane first, owners in turn, skipping saturated hosts.
+        """
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        now = time.monotonic()
+        for owners in self.lanes:
+            while self.in_flight < self.max_in_flight:
+                for owner, waiters in owners.items():
+                    # Cancelled waiters still queued remove themselves once they resume
+                    waiter = next((waiter for waiter in waiters if not waiter[1].done() and self._admissible(waiter[0], now)), None)
+                    if waiter:
+                        break
+                else:
+                    break
+                waiters.remove(waiter)
+                self._admit(waiter[0])
+                waiter[1].set_result(None)
+                # The owner served goes to the back of the lane
+                if waiters:
+                    owners.move_to_end(owner)
+                else:
+                    del owners[owner]
+        self._update_gauges()
+        
+        if self.host_rate and self.in_flight < self.max_in_flight:
+            # Come back when the next token of a rate limited host is available
+            delays = [
+                (1 - self.hosts[host].tokens) / self.host_rate
+                for owners in self.lanes for waiters in owners.values() for host, _ in waiters
+                if host in self.hosts and self.hosts[host].tokens < 1
+            ]
+            if delays:
+                self.timer = asyncio.get_running_loop().call_later(min(delays), self._dispatch)
+
+    def _remove(self, waiter, owner) -> bool:
+        for owners in self.lanes:
+            waiters = owners.get(owner)
+            if waiters and waiter in waiters:
+                waiters.remove(waiter)
+                if not waiters:
+                    del owners[owner]
+                return True
+        return False
+
+    def promote(self, waiter, owner, lane: int):
+        """
+        Moves a queued request to a higher priority lane.
+        """
+        if not waiter[1].done() and self._remove(waiter, owner):
+            self.lanes[lane].setdefault(owner, deque()).append(waiter)
+            self._dispatch()
+
+    async def acquire(self, url: str):
+        """
+        Waits for a slot to request `url`, in the lane (or shared lane) and for the owner of the current task.
+        """
+        host = self.host_of(url)
+        if not self.waiting() and self._admissible(host, time.monotonic()):
+            self._admit(host)
+            return
+        
+        group, owner = shared_lane.get(), fetch_owner.get()
+        lane = group.lane if group else fetch_lane.get()
+        waiter = (host, asyncio.get_running_loop().create_future())
+        self.lanes[lane].setdefault(owner, deque()).append(waiter)
+        if group:
+            group.queued[waiter] = (self, owner)
+        self._dispatch()
+        try:
+            with stage("fetch_wait"):
+                await waiter[1]
+        except asyncio.CancelledError:
+            if not waiter[1].cancelled():
+                # The slot was granted as the waiter got cancelled
+                self.release(url)
+            else:
+                self._remove(waiter, owner)
+                self._update_gauges()
+            raise
+        finally:
+            if group:
+                group.queued.pop(waiter, None)
+
+    def _prune(self, now: float):
+        """
+        Forgets the idle rate limited hosts whose bucket has refilled, a new state of the host starts out the same.
+        Sweeps at most once per refill period of a bucket.
+        """
+        if not self.host_rate or now - self.pruned < self.host_burst / self.host_rate:
+            return
+        self.pruned = now
+        for host, state in list(self.hosts.items()):
+            if not state.active and state.tokens + (now - state.updated) * self.host_rate >= self.host_burst:
+                del self.hosts[host]
+
+    def release(self, url: str):
+        state = self._host(self.host_of(url))
+        state.active -= 1
+        self.in_flight -= 1
+        if not state.active and not self.host_rate:
+            del self.hosts[self.host_of(url)]
+        self._prune(time.monotonic())
+        if self.waiting():
+            self._dispatch()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, url: str):
+        await self.acquire(url)
+        try:
+            yield
+        finally:
+            self.release(url)
@@ -0,0 +1,86 @@
+import time
+import threading
+from urllib.parse import urlsplit
+
+
+class HostRoute:
+    DIRECT = "direct"
+    PROXY = "proxy"
+    BLOCKED = "blocked"
+
+
+def is_host_failure(status_code: int) -> bool:
+    """
+    Whether an error status says something about the host (blocking, rate limiting, server errors)
+    rather than the requested URL only, like `404 Not Found` or `410 Gone`.
+    """
+    return status_code in (403, 407, 408, 429) or status_code >= 500
+
+
+class HostRouter:
+    """
+    Per-host routing table learned from fetch results.
+    Hosts that keep failing direct fetches are sent straight to the proxy, hosts that keep
+    failing on both paths are short-circuited for a cooldown period.
+    """
+    def __init__(self, proxy_after_failures: int = 2, block_after_failures: int = 3,
+                 cooldown: float = 300, relearn_after: float = 3600):
+        """
+        Args:
+            proxy_after_failures: Consecutive direct failures after which a host goes straight to the proxy.
+            block_after_failures: Consecutive failures of both paths after which a host is short-circuited.
+            cooldown: Seconds a short-circuited host is skipped.
+            relearn_after: Seconds after the last direct failure when direct fetches are tried again.
+        """
+        self.proxy_after_failures = proxy_after_failures
+        self.block_after_failures = block_after_failures
+        self.cooldown = cooldown
+        self.relearn_after = relearn_after
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def host_of(url: str) -> str:
+        return (urlsplit(url).hostname or "").lower()
+
+    def route(self, url: str) -> str:
+        """
+        Returns:
+            One of `HostRoute.DIRECT`, `HostRoute.PROXY` or `HostRoute.BLOCKED`.
+        """
+        now = time.monotonic()
+        with self.lock:
+            stats = self.hosts.get(self.host_of(url))
+            if not stats:
+                return HostRoute.DIRECT
+            if stats["blocked_until"] > now:
+                return HostRoute.BLOCKED
+            if stats["direct_failures"] >= self.proxy_after_failures and now - stats["direct_failed_at"] < self.relearn_after:
+                return HostRoute.PROXY
+            return HostRoute.DIRECT
+
+    def record(self, url: str, direct_ok: bool|None, proxy_ok: bool|None):
+        """
+        Records the outcome of a fetch. `None` means the path was not tried (or gave no answer).
+        Only transport errors, timeouts and host failure statuses (see `is_host_failure`) count as failures.
+        """
+        now = time.monotonic()
+        with self.lock:
+            stats = self.hosts.setdefault(self.host_of(url), {
+                "direct_failures": 0,
+                "direct_failed_at": 0.0,
+                "failures": 0,
+                "blocked_until": 0.0,
+            })
+            if direct_ok:
+                stats["direct_failures"] = 0
+            elif direct_ok is False:
+                stats["direct_failures"] += 1
+                stats["direct_failed_at"] = now
+            
+            if direct_ok or proxy_ok:
+                stats["failures"] = 0
+            elif direct_ok is not None or proxy_ok is not None:
+                stats["failures"] += 1
+                if stats["failures"] >= self.block_after_failures:
+                    stats["blocked_until"] = now + self.cooldown
@@ -0,0 +1,168 @@
+import httpx
+from metrics import BYTES_DOWNLOADED
+from fetch_scheduler import FetchScheduler
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class UnsupportedContent(Exception):
+    """
+    Raised when a response is rejected based on its headers, before the body is read.
+    """
+    def __init__(self, content_type: str, content_length: int|None):
+        super().__init__(f"Unsupported content: {content_type or 'unknown type'}, {content_length if content_length is not None else 'unknown'} bytes")
+        self.content_type = content_type
+        self.content_length = content_length
+
+
+class FetchedResponse:
+    """
+    Response of `HttpClient.fetch`, with a body capped at a maximum size.
+    """
+    def __init__(self, url: str, status_code: int, headers: httpx.Headers, content: bytes,
+                 encoding: str|None, truncated: bool):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.encoding = encoding
+        self.truncated = truncated
+
+    @property
+    def content_type(self) -> str:
+        return media_type(self.headers)
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+
+def media_type(headers) -> str:
+    return headers.get("content-type", "").split(";")[0].strip().lower()
+
+
+class HttpClient:
+    """
+    Async HTTP client backed by a single keep-alive connection pool.
+    One instance is meant to be shared by the whole process, so connections (and their
+    DNS/TCP/TLS setup) are reused across page fetches and tool calls.
+    """
+    def __init__(self, max_connections: int = 100, max_connections_per_host: int = 6,
+                 keepalive_expiry: float = 30.0, connect_timeout: float = 5.0, timeout: float = 30.0,
+                 scheduler: FetchScheduler|None = None):
+        """
+        Args:
+            max_connections: Upper bound of open connections in the pool.
+            max_connections_per_host: Upper bound of concurrent requests to a single host, when no scheduler is passed.
+            keepalive_expiry: Seconds an idle connection is kept open for reuse.
+            connect_timeout: Default timeout for establishing a connection.
+            timeout: Default timeout for the whole request, used when a call doesn't pass its own.
+            scheduler: Admission control every request waits for, limiting requests per host and in total.
+        """
+        self.scheduler = scheduler or FetchScheduler(max_in_flight=max_connections, max_per_host=max_connections_per_host)
+        self.connect_timeout = connect_timeout
+        self.timeout = timeout
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Created lazily so the pool binds to the running event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=HTTP2_AVAILABLE,
+                limits=self.limits,
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                follow_redirects=True,
+            )
+        return self._client
+
+    async def get(self, url: str, timeout: float|None = None, **kwargs) -> httpx.Response:
+        """
+        Sends a GET request through the shared pool.
+
+        Args:
+            url: The URL to request.
+            timeout: Overall request timeout in seconds, defaults to the client timeout.
+            **kwargs: Passed to `httpx.AsyncClient.get` (headers, params, ...).
+
+        Returns:
+            The response. Status codes are not checked.
+        """
+        if timeout is not None:
+            kwargs["timeout"] = httpx.Timeout(timeout, connect=min(self.connect_timeout, timeout))
+        async with self.scheduler.slot(url):
+            return await self.client.get(url, **kwargs)
+
+    async def fetch(self, url: str, timeout: float|None = None, max_bytes: int|None = None,
+                    accept=None, **kwargs) -> FetchedResponse:
+        """
+        Streams a GET response, checking its headers before the body is read and
+        stopping the read at `max_bytes`, so memory per request stays bounded.
+
+        Args:
+            url: The URL to request.
+            timeout: Overall request timeout in seconds, defaults to the client timeout.
+            max_bytes: Maximum number of body bytes read, the rest is discarded.
+            accept: Optional function of (content type, content length) deciding whether to read the body.
+            **kwargs: Passed to `httpx.AsyncClient.stream` (headers, params, ...).
+
+        Returns:
+            The response, for any 2xx or `304 Not Modified` status.
+
+        Raises:
+            httpx.HTTPError: On transport errors and error statuses.
+            UnsupportedContent: When `accept` rejects the response.
+        """
+        if timeout is not None:
+            kwargs["timeout"] = httpx.Timeout(timeout, connect=min(self.connect_timeout, timeout))
+        async with self.scheduler.slot(url):
+            async with self.client.stream("GET", url, **kwargs) as response:
+                if response.status_code == 304:
+                    return FetchedResponse(str(response.url), 304, response.headers, b"", None, False)
+                response.raise_for_status()
+                
+                content_length = response.headers.get("content-length")
+                content_length = int(content_length) if content_length and content_length.isdigit() else None
+                if accept and not accept(media_type(response.headers), content_length):
+                    raise UnsupportedContent(media_type(response.headers), content_length)
+                
+                chunks, size, truncated = [], 0, False
+                async for chunk in response.aiter_bytes():
+                    if max_bytes is not None and size + len(chunk) > max_bytes:
+                        chunks.append(chunk[:max_bytes - size])
+                        truncated = True
+                        break
+                    chunks.append(chunk)
+                    size += len(chunk)
+                
+                content = b"".join(chunks)
+                BYTES_DOWNLOADED.inc(len(content))
+                return FetchedResponse(str(response.url), response.status_code, response.headers,
+                                       content, response.charset_encoding, truncated)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+_default_client = None
+
+
+def get_default_client() -> HttpClient:
+    """
+    Returns the process-wide client used when no client is passed explicitly.
+    """
+    global _default_client
+    if _default_client is None:
+        _default_client = HttpClient()
+    return _default_client
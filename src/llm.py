@@ -1,16 +1,22 @@
-import os
+import asyncio
 import logging
+import random
 import re
-from openai import OpenAI
+from openai import AsyncOpenAI, BadRequestError, RateLimitError
+from markdown_sections import estimate_tokens, pack_windows, merge_ranges, split_long_lines
+from trim_cache import TrimCache
+from metrics import stage, CACHE_REQUESTS, LLM_TOKENS
 
 
 SYSTEM_PROMPT="""
-You are an expert text analyzer. Your task is to identify the most relevant contiguous block of lines in the provided line-numbered text that directly addresses the topics mentioned in the context. Ignore irrelevant sections like navigation menus, sidebars, headers, footers, advertisements, and unrelated comments. Focus solely on the core content related to the context.
-Based *only* on the provided context and line-numbered content, identify the single most relevant contiguous block of lines that discusses the topics in the context. Exclude any surrounding noise (navbars, footers, irrelevant comments, etc.).
+You are an expert text analyzer. Your task is to identify the relevant contiguous blocks of lines in the provided line-numbered text that directly address the topics mentioned in the context. Ignore irrelevant sections like navigation menus, sidebars, headers, footers, advertisements, and unrelated comments. Focus solely on the core content related to the context.
+Based *only* on the provided context and line-numbered content, identify up to {max_ranges} relevant contiguous blocks of lines that discuss the topics in the context, most relevant first. Exclude any surrounding noise (navbars, footers, irrelevant comments, etc.). The content may be an excerpt of a longer page, use the line numbers exactly as given.
 
-Respond *only* with the starting and ending line numbers of this block, formatted exactly as: `START: <start_line_number>, END: <end_line_number>`.
+Respond *only* with the starting and ending line numbers of each block, one block per line, formatted exactly as: `START: <start_line_number>, END: <end_line_number>`.
 
-Example Response: `START: 15, END: 88`
+Example Response:
+`START: 15, END: 88`
+`START: 120, END: 131`
 
 If no relevant block is found, respond only with `START: 0, END: 0`.
 """
@@ -26,75 +32,244 @@ Line-numbered Content:
 """
 
 
+PAIR_PATTERN = re.compile(r"start:\s*(\d+)\W*end:\s*(\d+)", re.IGNORECASE)
+# A pair is only known to be complete once something follows its last digit
+COMPLETE_PAIR_PATTERN = re.compile(r"start:\s*(\d+)\W*end:\s*(\d+)\D", re.IGNORECASE)
+
+
 class Assistant:
 
-    def __init__(self, api_key, api_url, model_name):
+    def __init__(self, api_key, api_url, model_name, window_tokens: int = 8000, max_page_tokens: int = 32000,
+                 max_parallel: int = 4, max_ranges: int = 3, trim_cache: TrimCache|None = None,
+                 max_concurrency: int = 16, timeout: float = 60, max_retries: int = 3, retry_delay: float = 1):
+        """
+        Args:
+            window_tokens: Token budget of the content sent in a single prompt.
+            max_page_tokens: Hard ceiling of content tokens sent for one page, later windows are dropped.
+            max_parallel: Number of windows of one page asked about at the same time.
+            max_ranges: Number of relevant blocks the model may select per window.
+            trim_cache: Optional cache of selected ranges, identical requests skip the LLM.
+            max_concurrency: Number of LLM requests in flight at once, across all pages and tool calls.
+            timeout: Deadline in seconds of a single LLM call, retries included.
+            max_retries: Number of retries of a rate limited (`429`) request.
+            retry_delay: Base delay of the exponential, jittered backoff between retries.
+        """
         self.api_key = api_key
         self.api_url = api_url
         self.model_name = model_name
-        self.client = OpenAI(api_key=self.api_key, base_url=self.api_url)
+        self.window_tokens = window_tokens
+        self.max_page_tokens = max_page_tokens
+        self.max_parallel = max_parallel
+        self.max_ranges = max_ranges
+        self.trim_cache = trim_cache
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        # One client for the whole process, its connection pool is shared by all calls; retries are done here
+        self.client = AsyncOpenAI(api_key=self.api_key, base_url=self.api_url, max_retries=0)
+        # Cleared once the server rejects `stream_options`, usage is estimated from then on
+        self.stream_usage = True
+
+
+    async def _create_stream(self, messages: list[dict]):
+        if not self.stream_usage:
+            return await self.client.chat.completions.create(model=self.model_name, messages=messages, stream=True)
+        try:
+            return await self.client.chat.completions.create(model=self.model_name, messages=messages, stream=True,
+                                                             stream_options={"include_usage": True})
+        except BadRequestError as e:
+            # Servers that don't know `stream_options` reject the request, retry once without it
+            try:
+                stream = await self.client.chat.completions.create(model=self.model_name, messages=messages, stream=True)
+            except BadRequestError:
+                raise e
+            logging.warning(f"LLM server rejected stream_options, estimating token usage instead: {e}")
+            self.stream_usage = False
+            return stream
 
 
-    def get_response(self, system_prompt: str, query: str) -> str | None:
+    async def _stream_response(self, messages: list[dict], is_complete) -> str:
+        """
+        Streams a completion, stopping as soon as `is_complete` accepts the text received so far.
+        Closing the stream early ends the generation, so the remaining tokens aren't paid for.
+        """
+        text = ""
+        usage = None
+        with stage("llm"):
+            stream = await self._create_stream(messages)
+            async with stream:
+                async for chunk in stream:
+                    usage = getattr(chunk, "usage", None) or usage
+                    if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+                        text += chunk.choices[0].delta.content
+                        if is_complete and is_complete(text):
+                            break
         
+        # Usage comes with the last chunk, so it is only missing when the stream was cut
+        # (or the server doesn't report it), estimate it then
+        sent = usage.prompt_tokens if usage else sum(estimate_tokens(message["content"]) for message in messages)
+        received = usage.completion_tokens if usage else estimate_tokens(text)
+        LLM_TOKENS.inc(sent, direction="sent")
+        LLM_TOKENS.inc(received, direction="received")
+        return text
+
+
+    async def get_response(self, system_prompt: str, query: str, is_complete=None) -> str | None:
+        """
+        Args:
+            system_prompt: The system message.
+            query: The user message.
+            is_complete: Optional function of the text received so far, returning True once it holds everything needed.
+
+        Returns:
+            The response text, or None when the call failed or missed its deadline.
+        """
         messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": query}]
-        try:
-            response = self.client.chat.completions.create(model=self.model_name, messages=messages)
-            if response.choices and response.choices[0].message:
-                return response.choices[0].message.content.strip()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        
+        async with self.semaphore:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    text = await asyncio.wait_for(self._stream_response(messages, is_complete), deadline - loop.time())
+                    return text.strip()
+                
+                except RateLimitError as e:
+                    delay = self.retry_delay * 2 ** attempt * random.uniform(0.5, 1.5)
+                    try:
+                        delay = max(delay, float(e.response.headers.get("retry-after", 0)))
+                    except ValueError:
+                        pass
+                    if attempt == self.max_retries or loop.time() + delay >= deadline:
+                        logging.error(f"LLM call rate limited, giving up after {attempt + 1} attempts: {e}")
+                        return None
+                    logging.warning(f"LLM call rate limited, retrying in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+                
+                except asyncio.TimeoutError:
+                    logging.error(f"LLM call exceeded its {self.timeout}s deadline")
+                    return None
+                
+                except Exception as e:
+                    logging.error(f"An unexpected error occurred during LLM call: {e}")
+                    return None
+        return None
+
+
+    async def aclose(self):
+        await self.client.close()
+
+
+    def _has_all_ranges(self, text: str) -> bool:
+        pairs = COMPLETE_PAIR_PATTERN.findall(text)
+        return len(pairs) >= self.max_ranges or ("0", "0") in pairs
+
+
+    async def select_ranges(self, context: str, lines: list[str], start: int, end: int) -> list[tuple[int, int]] | None:
+        """
+        Asks the model for the relevant blocks of one window of lines.
+        The response is streamed and cut once `max_ranges` blocks (or the "nothing relevant" answer) arrived.
+
+        Args:
+            context: A string describing the relevant topics or context.
+            lines: All lines of the content.
+            start: Index of the first line of the window.
+            end: Index after the last line of the window.
+
+        Returns:
+            A list of inclusive 1-based line ranges (empty when nothing is relevant), or None on failure.
+        """
+        numbered_content = "".join(f"{i+1} | {lines[i]}\n" for i in range(start, end))
+        
+        system_prompt = SYSTEM_PROMPT.format(max_ranges=self.max_ranges)
+        user_prompt = USER_PROMPT.format(context=context, numbered_content=numbered_content)
+        
+        llm_output = await self.get_response(system_prompt, user_prompt, self._has_all_ranges)
+        if llm_output is None:
             return None
         
-        except Exception as e:
-            logging.error(f"An unexpected error occurred during LLM call: {e}")
+        pairs = PAIR_PATTERN.findall(llm_output)
+        if not pairs:
+            logging.error(f"LLM response did not match expected format 'START: <num>, END: <num>'. Response:\n'{llm_output}'")
             return None
+        
+        ranges = []
+        for start_line, end_line in ((int(a), int(b)) for a, b in pairs[:self.max_ranges]):
+            if start_line == 0 and end_line == 0:
+                continue
+            if start < start_line <= end_line <= end:
+                ranges.append((start_line, end_line))
+            else:
+                logging.error(f"LLM returned invalid line range: {start_line}-{end_line} for window {start+1}-{end}.")
+        return ranges
 
 
-    def context_trim(self, context: str, content: str) -> str|None:
+    async def context_trim(self, context: str, content: str) -> str|None:
         """
         Analyzes content based on context and returns the trimmed content string
-        containing the most relevant section, excluding noise like navbars, footers, etc.
-        
+        containing the most relevant sections, excluding noise like navbars, footers, etc.
+        Long content is split into token-budgeted windows on heading boundaries, the windows are
+        analyzed concurrently and the selected ranges merged.
+
         Args:
             context: A string describing the relevant topics or context.
             content: The content (e.g., markdown) to analyze.
-        
+
         Returns:
             A string containing the trimmed relevant content, empty string when no relevant content, or None.
         """
         
         try:
-            lines = content.splitlines()
-            numbered_content = ""
-            for i, line in enumerate(lines):
-                numbered_content += f"{i+1} | {line}\n"
+            # Lines are cut to a fraction of a window, so a window never exceeds its budget
+            lines = split_long_lines(content.splitlines(), max(self.window_tokens // 4, 1))
+            cache_key = TrimCache.key(content, context, self.model_name) if self.trim_cache else None
+            ranges = await asyncio.to_thread(self.trim_cache.get, cache_key) if cache_key else None
+            if cache_key:
+                CACHE_REQUESTS.inc(cache="trim", result="hit" if ranges is not None else "miss")
+            if ranges is not None:
+                logging.info("Context trim served from cache.")
+                return "\n\n".join("\n".join(lines[start-1:end]) for start, end in ranges)
             
-            system_prompt = SYSTEM_PROMPT
-            user_prompt = USER_PROMPT.format(context=context, numbered_content=numbered_content)
-                        
-            llm_output = self.get_response(system_prompt, user_prompt)
+            windows = pack_windows(lines, self.window_tokens, line_overhead=estimate_tokens(f"{len(lines)} | "))
             
-            start_match = re.search(r"start:\s*(\d+)", llm_output, re.IGNORECASE | re.MULTILINE)
-            end_match = re.search(r"end:\s*(\d+)", llm_output, re.IGNORECASE | re.MULTILINE)
+            # Hard per-page ceiling on the content sent to the model, the last window kept may be cut short
+            budget = self.max_page_tokens
+            kept_windows = []
+            for start, end in windows:
+                stop = start
+                while stop < end and estimate_tokens(lines[stop]) <= budget:
+                    budget -= estimate_tokens(lines[stop])
+                    stop += 1
+                if stop > start:
+                    kept_windows.append((start, stop))
+                if stop < end:
+                    logging.info(f"Page exceeds {self.max_page_tokens} tokens, analyzing only lines 1-{stop} of {len(lines)}.")
+                    break
+            windows = kept_windows
             
-            if start_match and end_match:
-                start_line = int(start_match.group(1))
-                end_line = int(end_match.group(1))
-                
-                if start_line == 0 and end_line == 0:
-                    logging.info("LLM indicated no relevant block found.")
-                    return ""
-                
-                if 0 < start_line <= end_line <= len(lines):
-                    logging.info(f"Context trim successful. Range: {start_line}-{end_line}")
-                    trimmed_content_lines = lines[start_line-1:end_line]
-                    trimmed_content = "\n".join(trimmed_content_lines)
-                    return trimmed_content
-                else:
-                    logging.error(f"LLM returned invalid line range: {start_line}-{end_line} for content with {len(lines)} lines.")
-                    return None
-            else:
-                logging.error(f"LLM response did not match expected format 'start: <num>\\nend: <num>'. Response:\n'{llm_output}'")
+            page_semaphore = asyncio.Semaphore(self.max_parallel)
+            
+            async def select_window(start: int, end: int):
+                async with page_semaphore:
+                    return await self.select_ranges(context, lines, start, end)
+            
+            results = await asyncio.gather(*(select_window(start, end) for start, end in windows))
+            
+            if all(result is None for result in results):
                 return None
+            
+            ranges = merge_ranges([line_range for result in results if result for line_range in result])
+            # Partial results (some windows failed) are not cached
+            if cache_key and all(result is not None for result in results):
+                await asyncio.to_thread(self.trim_cache.set, cache_key, ranges)
+            
+            if not ranges:
+                logging.info("LLM indicated no relevant block found.")
+                return ""
+            
+            logging.info(f"Context trim successful. Ranges: {', '.join(f'{start}-{end}' for start, end in ranges)}")
+            return "\n\n".join("\n".join(lines[start-1:end]) for start, end in ranges)
         
         except Exception:
             return None
@@ -2,27 +2,127 @@ import os
 import uvicorn
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse
 
 from mcp import MCP
-from mcp_tools import SearchTool, PrintPageTool, SearchAndPrintPageTool
+from mcp_tools import SearchTool, PrintPageTool, PrintPagesTool, SearchAndPrintPageTool
+from http_client import HttpClient
+from fetch_scheduler import FetchScheduler
+from document_store import DocumentStore
+from llm import Assistant
+from trim_cache import TrimCache
+from host_router import HostRouter
+from page_cache import PageCache
+from search_cache import SearchCache
+from prefetcher import Prefetcher
+from session_backend import SessionBackend, RedisSessionBackend
+import metrics
 
 
 
 load_dotenv(dotenv_path="./env/.env")
 
+
+def env_int(name: str, default: int|None = None) -> int|None:
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def env_float(name: str, default: float|None = None) -> float|None:
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
 api_key = os.environ.get("OPENAI_API_KEY")
 api_url = os.environ.get("OPENAI_API_URL", None)
 model_name = os.environ.get("OPENAI_MODEL_NAME")
 brave_api_key = os.environ.get("BRAVE_API_KEY")
+brave_api_url = os.environ.get("BRAVE_API_URL")
 proxy = os.environ.get("PROXY", None)
+max_tool_workers = env_int("MAX_TOOL_WORKERS", 32)
+prefetch_top_n = env_int("PREFETCH_TOP_N", 0)
+redis_url = os.environ.get("REDIS_URL")
+web_workers = env_int("WEB_WORKERS", 1)
+session_idle_ttl = env_float("SESSION_IDLE_TTL", 3600)
 
-search_tool_instance = SearchTool(brave_api_key=brave_api_key)
-print_page_tool_instance = PrintPageTool(proxy)
+http_client = HttpClient(
+    max_connections=env_int("HTTP_MAX_CONNECTIONS", 100),
+    scheduler=FetchScheduler(
+        max_in_flight=env_int("FETCH_MAX_IN_FLIGHT", 64),
+        max_per_host=env_int("HTTP_MAX_CONNECTIONS_PER_HOST", 6),
+        host_rate=env_float("FETCH_HOST_RATE"),
+        host_burst=env_float("FETCH_HOST_BURST"),
+        host_limits={FetchScheduler.host_of(proxy): env_int("PROXY_MAX_IN_FLIGHT", 16)} if proxy else None,
+    ),
+)
+
+print_page_tool_instance = PrintPageTool(
+    proxy,
+    http_client,
+    direct_timeout=env_float("FETCH_TIMEOUT", 10),
+    proxy_timeout=env_float("PROXY_TIMEOUT", 30),
+    hedge_delay=env_float("PROXY_HEDGE_DELAY", 2),
+    router=HostRouter(
+        proxy_after_failures=env_int("PROXY_AFTER_FAILURES", 2),
+        block_after_failures=env_int("HOST_BLOCK_AFTER_FAILURES", 3),
+        cooldown=env_float("HOST_COOLDOWN", 300),
+    ),
+    cache=PageCache(
+        max_bytes=env_int("PAGE_CACHE_MAX_BYTES", 64 * 1024 * 1024),
+        ttl=env_float("PAGE_CACHE_TTL", 300),
+        path=os.environ.get("PAGE_CACHE_PATH"),
+        max_disk_bytes=env_int("PAGE_CACHE_MAX_DISK_BYTES", 512 * 1024 * 1024),
+    ),
+    max_bytes=env_int("MAX_PAGE_BYTES", 5 * 1024 * 1024),
+    documents=DocumentStore(
+        max_bytes=env_int("DOCUMENT_STORE_MAX_BYTES", 64 * 1024 * 1024),
+        ttl=env_float("DOCUMENT_STORE_TTL", 1800),
+    ),
+    max_chars=env_int("PRINT_PAGE_MAX_CHARS", 50000),
+)
+search_tool_instance = SearchTool(
+    brave_api_key=brave_api_key,
+    brave_api_url=brave_api_url,
+    http_client=http_client,
+    cache=SearchCache(
+        max_entries=env_int("SEARCH_CACHE_MAX_ENTRIES", 1024),
+        ttl=env_float("SEARCH_CACHE_TTL", 600),
+    ),
+    prefetcher=Prefetcher(
+        print_page_tool_instance,
+        top_n=prefetch_top_n,
+        queue_size=env_int("PREFETCH_QUEUE_SIZE", 32),
+        workers=env_int("PREFETCH_WORKERS", 2),
+        mode=os.environ.get("PREFETCH_MODE", "full"),
+    ) if prefetch_top_n else None,
+)
 
 app = FastAPI()
+app.router.add_event_handler("shutdown", http_client.aclose)
+if search_tool_instance.prefetcher:
+    app.router.add_event_handler("shutdown", search_tool_instance.prefetcher.aclose)
+
 
-mcp_server = MCP(app=app)
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+mcp_server = MCP(
+    app=app,
+    max_workers=max_tool_workers,
+    max_sessions=env_int("MAX_SESSIONS", 1000),
+    session_idle_ttl=session_idle_ttl,
+    queue_size=env_int("SESSION_QUEUE_SIZE", 100),
+    queue_overflow=os.environ.get("SESSION_QUEUE_OVERFLOW", "block"),
+    inline_response_timeout=env_float("INLINE_RESPONSE_TIMEOUT", 1),
+    debug_trace=os.environ.get("DEBUG_TRACE", "").lower() in ("1", "true", "yes"),
+    backend=RedisSessionBackend(
+        redis_url,
+        idle_ttl=session_idle_ttl,
+        prefix=os.environ.get("REDIS_PREFIX", "mcp"),
+    ) if redis_url else SessionBackend(session_idle_ttl),
+)
 
 mcp_server.add_tool(
     {
@@ -36,40 +136,118 @@ mcp_server.add_tool(
             "required": ["query"],
         }
     },
-    search_tool_instance.execute
+    search_tool_instance.execute,
+    max_concurrency=env_int("SEARCH_WEB_MAX_CONCURRENCY")
 )
 
 mcp_server.add_tool(
     {
         "name": "print_page",
-        "description": "Fetches and prints a web page as markdown.",
+        "description": "Fetches and prints a web page as markdown. Long pages are returned in chunks, continue with the cursor given at the end of a chunk.",
         "inputSchema": {
             "type": "object",
             "properties": {
                 "url": {"type": "string", "description": "The URL of the web page to print."},
+                "mode": {
+                    "type": "string",
+                    "enum": ["full", "clean", "article"],
+                    "description": "full: the whole page. clean: without scripts, navigation, banners and footers. article: only the main content of the page. Defaults to full.",
+                },
+                "offset": {"type": "integer", "description": "Optional character offset to start at, relative to the section when one is selected."},
+                "max_chars": {"type": "integer", "description": "Optional size of the returned chunk in characters."},
+                "section": {"type": "string", "description": "Optional heading text, only that section of the page is returned."},
+                "cursor": {"type": "string", "description": "Cursor from the end of a previous chunk, continues where it ended."},
             },
             "required": ["url"],
         }
     },
-    print_page_tool_instance.execute
+    print_page_tool_instance.read,
+    max_concurrency=env_int("PRINT_PAGE_MAX_CONCURRENCY")
 )
 
-if api_key and model_name:
-    search_and_print_page_tool_instance = SearchAndPrintPageTool(api_key, api_url, model_name, brave_api_key, proxy)
-    mcp_server.add_tool(
-        {
-            "name": "search_process_pages",
-            "description": "Searches web, fetches pages, trims content based on context, returns formatted results. Prefer using this tool for all research, as it incorporates both searching and processing information in short form, minimising context usage.",
-            "inputSchema": {
-                "type": "object",
-                "properties": {
-                    "query": {"type": "string", "description": "The search query."},
-                    "context": {"type": "string", "description": "Used to filter out irrevelant page contents. An external LLM will return page content exclusively relevant to it."},
+print_pages_tool_instance = PrintPagesTool(
+    print_page_tool_instance,
+    max_parallel=env_int("PRINT_PAGES_MAX_PARALLEL", 8),
+    max_chars_per_page=env_int("PRINT_PAGES_MAX_CHARS_PER_PAGE", 20000),
+    max_total_chars=env_int("PRINT_PAGES_MAX_TOTAL_CHARS", 100000),
+)
+mcp_server.add_tool(
+    {
+        "name": "print_pages",
+        "description": "Fetches and prints several web pages as markdown in one call. Prefer it over multiple print_page calls. Every page is preceded by its status, load time and size.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "urls": {"type": "array", "items": {"type": "string"}, "description": "The URLs of the web pages to print."},
+                "mode": {
+                    "type": "string",
+                    "enum": ["full", "clean", "article"],
+                    "description": "full: whole pages. clean: without scripts, navigation, banners and footers. article: only the main content of every page. Defaults to full.",
+                },
+                "max_chars_per_page": {"type": "integer", "description": "Optional cap of the characters returned per page."},
+                "max_total_chars": {"type": "integer", "description": "Optional cap of the characters returned for all pages together."},
+            },
+            "required": ["urls"],
+        }
+    },
+    print_pages_tool_instance.execute,
+    max_concurrency=env_int("PRINT_PAGES_MAX_CONCURRENCY")
+)
+
+search_and_print_page_tool_instance = SearchAndPrintPageTool(
+    api_key, api_url, model_name, brave_api_key, proxy,
+    print_page_tool=print_page_tool_instance,
+    search_tool=search_tool_instance,
+    page_mode=os.environ.get("SEARCH_PROCESS_PAGES_MODE", "article"),
+    assistant=Assistant(
+        api_key, api_url, model_name,
+        window_tokens=env_int("LLM_WINDOW_TOKENS", 8000),
+        max_page_tokens=env_int("LLM_MAX_PAGE_TOKENS", 32000),
+        max_parallel=env_int("LLM_MAX_PARALLEL", 4),
+        max_concurrency=env_int("LLM_MAX_CONCURRENCY", 16),
+        timeout=env_float("LLM_TIMEOUT", 60),
+        max_retries=env_int("LLM_MAX_RETRIES", 3),
+        trim_cache=TrimCache(
+            max_entries=env_int("TRIM_CACHE_MAX_ENTRIES", 4096),
+            path=os.environ.get("TRIM_CACHE_PATH"),
+        ),
+    ) if api_key and model_name else None,
+    prefilter_tokens=env_int("PREFILTER_TOKENS", 8000),
+    top_sections=env_int("TOP_SECTIONS", 3),
+    deadline=env_float("SEARCH_PROCESS_PAGES_DEADLINE"),
+    target_pages=env_int("SEARCH_PROCESS_PAGES_RESULTS", 4),
+    candidates=env_int("SEARCH_PROCESS_PAGES_CANDIDATES", 10),
+    max_parallel=env_int("SEARCH_PROCESS_PAGES_PARALLEL", 4),
+    token_budget=env_int("SEARCH_PROCESS_PAGES_TOKEN_BUDGET"),
+    duplicate_similarity=env_float("DUPLICATE_SIMILARITY", 0.7) or None,
+)
+if search_and_print_page_tool_instance.assistant:
+    app.router.add_event_handler("shutdown", search_and_print_page_tool_instance.assistant.aclose)
+mcp_server.add_tool(
+    {
+        "name": "search_process_pages",
+        "description": "Searches web, fetches pages, trims content based on context, returns formatted results. Prefer using this tool for all research, as it incorporates both searching and processing information in short form, minimising context usage.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "query": {"type": "string", "description": "The search query."},
+                "context": {"type": "string", "description": "Used to filter out irrevelant page contents. An external LLM will return page content exclusively relevant to it."},
+                "trim": {
+                    "type": "string",
+                    "enum": ["llm", "bm25"],
+                    "description": "llm: page content is trimmed by an external LLM. bm25: the best matching sections are picked locally, faster and cheaper but less precise. Defaults to llm when available.",
                 },
-                "required": ["query", "context"],
-            }
-        },
-        search_and_print_page_tool_instance.execute
-    )
+                "deadline": {"type": "number", "description": "Optional time limit in seconds. Pages not processed in time are marked as timed out."},
+            },
+            "required": ["query", "context"],
+        }
+    },
+    search_and_print_page_tool_instance.execute,
+    max_concurrency=env_int("SEARCH_PROCESS_PAGES_MAX_CONCURRENCY", 4)
+)
 
-uvicorn.run(app, host="0.0.0.0", port=5000)
+if __name__ == "__main__":
+    if web_workers > 1 and not redis_url:
+        print("WEB_WORKERS > 1 without REDIS_URL: messages only reach sessions opened on the same worker")
+    # Workers import the app by name, a single process serves the one already built here
+    uvicorn.run(app if web_workers == 1 else "main:app", host="0.0.0.0", port=env_int("PORT", 5000), workers=web_workers)
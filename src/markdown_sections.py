@@ -0,0 +1,100 @@
+import re
+
+
+ATX_HEADING = re.compile(r"^\s{0,3}#{1,6}\s")
+SETEXT_UNDERLINE = re.compile(r"^\s{0,3}(=+|-+)\s*$")
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count of a text, good enough for budgeting prompts.
+    """
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def split_sections(lines: list[str]) -> list[tuple[int, int]]:
+    """
+    Splits markdown lines into sections starting at headings (ATX `#` or setext underlined).
+
+    Returns:
+        A list of `(start, end)` line index ranges, end exclusive, covering all lines in order.
+    """
+    starts = [0]
+    for i, line in enumerate(lines):
+        if ATX_HEADING.match(line):
+            starts.append(i)
+        elif i > 0 and SETEXT_UNDERLINE.match(line) and lines[i - 1].strip() and not SETEXT_UNDERLINE.match(lines[i - 1]):
+            starts.append(i - 1)
+    starts = sorted(set(starts))
+    return [(start, end) for start, end in zip(starts, starts[1:] + [len(lines)]) if start < end]
+
+
+def split_long_lines(lines: list[str], max_tokens: int) -> list[str]:
+    """
+    Cuts lines longer than `max_tokens` into several lines, at a space when there is one, so documents
+    without line breaks (minified JSON, single-line text) can still be windowed and selected by line.
+    """
+    max_chars = max(max_tokens - 1, 1) * CHARS_PER_TOKEN
+    result = []
+    for line in lines:
+        while len(line) > max_chars:
+            cut = line.rfind(" ", max_chars // 2, max_chars)
+            cut = cut + 1 if cut > 0 else max_chars
+            result.append(line[:cut])
+            line = line[cut:]
+        result.append(line)
+    return result
+
+
+def pack_windows(lines: list[str], max_tokens: int, line_overhead: int = 0) -> list[tuple[int, int]]:
+    """
+    Packs consecutive sections into windows of at most `max_tokens`, cutting on heading boundaries.
+    Sections larger than a window are cut between lines, lines longer than a window have to be split
+    first (see `split_long_lines`).
+
+    Args:
+        lines: The markdown lines.
+        max_tokens: Token budget of a single window.
+        line_overhead: Extra tokens per line, e.g. for line numbers added to the prompt.
+
+    Returns:
+        A list of `(start, end)` line index ranges, end exclusive.
+    """
+    line_tokens = [estimate_tokens(line) + line_overhead for line in lines]
+    windows = []
+    window_start, window_tokens = 0, 0
+    for start, end in split_sections(lines):
+        section_tokens = sum(line_tokens[start:end])
+        if window_tokens and window_tokens + section_tokens > max_tokens:
+            windows.append((window_start, start))
+            window_start, window_tokens = start, 0
+        if section_tokens <= max_tokens:
+            window_tokens += section_tokens
+            continue
+        # Oversized section, cut it into line chunks
+        for i in range(start, end):
+            if window_tokens and window_tokens + line_tokens[i] > max_tokens:
+                windows.append((window_start, i))
+                window_start, window_tokens = i, 0
+            window_tokens += line_tokens[i]
+    if window_start < len(lines):
+        windows.append((window_start, len(lines)))
+    return windows
+
+
+def merge_ranges(ranges: list[tuple[int, int]], gap: int = 1) -> list[tuple[int, int]]:
+    """
+    Merges overlapping or nearly adjacent inclusive line ranges.
+
+    Args:
+        ranges: `(start, end)` pairs, both inclusive.
+        gap: Ranges separated by at most this many lines are joined.
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + gap + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
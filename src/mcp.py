@@ -1,19 +1,150 @@
 import json
+import time
 import uuid
 import asyncio
+import inspect
+import functools
+import contextlib
+import contextvars
+import concurrent.futures
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import RedirectResponse, JSONResponse
+from fastapi.responses import RedirectResponse, JSONResponse, Response
 from sse_starlette.sse import EventSourceResponse
+from session_backend import SessionBackend
+from fetch_scheduler import fetch_owner
+from metrics import Trace, current_trace, TOOL_SECONDS, TOOL_CALLS, SESSIONS, SESSION_QUEUE_MESSAGES, RUNNING_CALLS
 
 
 
+class Session:
+    """
+    An SSE stream held by this worker, with its bounded outgoing message queue.
+    """
+    def __init__(self, session_id: str, queue_size: int = 100, overflow: str = "block", send_timeout: float = 30):
+        """
+        Args:
+            session_id: The session identifier.
+            queue_size: Number of messages waiting to be streamed at most.
+            overflow: What happens when the queue is full: `block` waits up to `send_timeout` seconds
+                      for the client to catch up and closes the session otherwise, `drop_oldest` discards
+                      the oldest waiting message, `close` closes the session right away.
+            send_timeout: Seconds a `block` send waits for free space.
+        """
+        self.id = session_id
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.overflow = overflow
+        self.send_timeout = send_timeout
+        self.closed = asyncio.Event()
+
+
+    async def send(self, message: dict):
+        if self.closed.is_set():
+            return
+        
+        if self.queue.full():
+            if self.overflow == "drop_oldest":
+                self.queue.get_nowait()
+                print(f"Session {self.id} queue full, dropped the oldest message")
+            elif self.overflow == "close":
+                print(f"Session {self.id} queue full, closing session")
+                self.close()
+                return
+        
+        try:
+            await asyncio.wait_for(self.queue.put(message), timeout=self.send_timeout)
+        except asyncio.TimeoutError:
+            print(f"Session {self.id} client is not reading messages, closing session")
+            self.close()
+
+
+    def close(self):
+        """
+        Marks the session closed, its stream ends and the session is cleaned up by `MCP.close_session`.
+        """
+        self.closed.set()
+
+
+class ToolCall:
+    """
+    A running `tools/call` request. Tools can reach it through `current_tool_call`
+    to stream progress notifications to the client before the final result.
+    """
+    def __init__(self, request_id, progress_token, send):
+        """
+        Args:
+            request_id: JSON-RPC id of the request.
+            progress_token: Token the client asked progress notifications for, or None.
+            send: Coroutine function delivering a message to the client's session.
+        """
+        self.request_id = request_id
+        self.progress_token = progress_token
+        self.send = send
+
+
+    async def report_progress(self, progress: float, total: float|None = None, message: str|None = None):
+        """
+        Sends a `notifications/progress` message, if the client asked for progress with a progress token.
+        """
+        if self.progress_token is None:
+            return
+        
+        params = {"progressToken": self.progress_token, "progress": progress}
+        if total is not None:
+            params["total"] = total
+        if message is not None:
+            params["message"] = message
+        notification = {"jsonrpc": "2.0", "method": "notifications/progress", "params": params}
+        await self.send({"event": "message", "data": json.dumps(notification)})
+
+
+current_tool_call = contextvars.ContextVar("current_tool_call", default=None)
+
+PROTOCOL_VERSIONS = ("2024-11-05", "2025-03-26")
+SESSION_HEADER = "Mcp-Session-Id"
+
+
 class MCP:
-    def __init__(self, app: FastAPI, endpoint = ""):
+    def __init__(self, app: FastAPI, endpoint = "", max_workers: int|None = None, max_sessions: int = 1000,
+                 session_idle_ttl: float = 3600, queue_size: int = 100, queue_overflow: str = "block",
+                 backend: SessionBackend|None = None, inline_response_timeout: float = 1, debug_trace: bool = False):
+        """
+        Args:
+            app: The FastAPI application to register the routes on.
+            endpoint: Path prefix of the routes.
+            max_workers: Size of the worker pool for blocking tools.
+            max_sessions: Number of concurrent SSE sessions, further connections get `503`.
+            session_idle_ttl: Sessions without any client message for this many seconds are closed.
+            queue_size: Size of the outgoing message queue of a session.
+            queue_overflow: Policy when a session queue is full, see `Session`.
+            backend: Shares sessions and routes messages between workers, in-memory (single worker) by default.
+            inline_response_timeout: Seconds a Streamable HTTP POST waits for its result before switching
+                                     to a streamed response.
+            debug_trace: Attach the time spent in every stage to tool results, under `_meta.trace`.
+        """
         self.endpoint = endpoint.strip('/')
         if self.endpoint: self.endpoint = '/' + self.endpoint
         self.app = app
         self.tools = []
-        self.active_sse_connections = {}
+        self.sessions = {}
+        self.max_sessions = max_sessions
+        self.queue_size = queue_size
+        self.queue_overflow = queue_overflow
+        self.session_sweeper = None
+        self.backend = backend or SessionBackend(session_idle_ttl)
+        self.inline_response_timeout = inline_response_timeout
+        self.debug_trace = debug_trace
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mcp-tool")
+        self.running_calls = set()
+        self.session_calls = {}
+        self.requests = {}
+        self.background_tasks = set()
+        
+        SESSIONS.set_function(lambda: len(self.sessions))
+        SESSION_QUEUE_MESSAGES.set_function(lambda: sum(session.queue.qsize() for session in self.sessions.values()))
+        RUNNING_CALLS.set_function(lambda: len(self.running_calls))
+        
+        self.app.router.add_event_handler("startup", self.start)
+        self.app.router.add_event_handler("shutdown", self.stop)
         
         # idk what happens with that
         self.app.add_api_route(f"{self.endpoint}", self.sse_endpoint)
@@ -25,17 +156,308 @@ class MCP:
         self.app.add_api_route(f"//{self.endpoint}", self.sse_endpoint)
         self.app.add_api_route(f"//{self.endpoint}/sse", self.sse_endpoint)
         self.app.add_api_route(f"//{self.endpoint}/messages", self.post_handler, methods=["POST"], name="post_handler")
+        
+        # Streamable HTTP transport
+        self.app.add_api_route(f"{self.endpoint}/mcp", self.streamable_post, methods=["POST"])
+        self.app.add_api_route(f"{self.endpoint}/mcp", self.streamable_get, methods=["GET"])
+        self.app.add_api_route(f"{self.endpoint}/mcp", self.streamable_delete, methods=["DELETE"])
+
+
+    def add_tool(self, tool_dict, tool_method, max_concurrency: int|None = None):
+        """
+        Registers a tool. `tool_method` may be a coroutine function or a plain blocking callable;
+        blocking tools are run on the shared worker pool. `max_concurrency` caps how many calls
+        of this tool may run at once (None for no per-tool limit).
+        """
+        semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        self.tools.append({"tool_dict": tool_dict, "tool_method": tool_method, "semaphore": semaphore})
+
+
+    async def execute_tool(self, tool, arguments: dict):
+        tool_method = tool["tool_method"]
+        async with tool["semaphore"] or contextlib.nullcontext():
+            if inspect.iscoroutinefunction(tool_method):
+                return await tool_method(**arguments)
+            # Copy the context, so blocking tools see the current tool call and trace too
+            loop = asyncio.get_running_loop()
+            context = contextvars.copy_context()
+            return await loop.run_in_executor(self.executor, functools.partial(context.run, tool_method, **arguments))
+
+
+    async def call_tool(self, tool, arguments: dict, request_id, send, progress_token=None, session_id: str|None = None) -> dict:
+        # Runs in its own task, so the context variables are scoped to this call
+        current_tool_call.set(ToolCall(request_id, progress_token, send))
+        fetch_owner.set(session_id)
+        trace = Trace() if self.debug_trace else None
+        current_trace.set(trace)
+        tool_name = tool["tool_dict"]["name"]
+        started = time.perf_counter()
+        try:
+            tool_result = await self.execute_tool(tool, arguments)
+            response = {
+                "jsonrpc": "2.0",
+                "id": request_id,
+                "result": {
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": tool_result or ""
+                        }
+                    ]
+                }
+            }
+            TOOL_CALLS.inc(tool=tool_name, status="ok")
+        except asyncio.CancelledError:
+            TOOL_CALLS.inc(tool=tool_name, status="cancelled")
+            raise
+        except Exception as e:
+            response = {
+                "jsonrpc": "2.0",
+                "id": request_id,
+                "error": {"code": -32603, "message": f"Internal error during tool execution: {e}"}
+            }
+            TOOL_CALLS.inc(tool=tool_name, status="error")
+        
+        TOOL_SECONDS.observe(time.perf_counter() - started, tool=tool_name)
+        if trace and "result" in response:
+            response["result"]["_meta"] = {"trace": trace.summary()}
+        return response
+
+
+    async def handle_message(self, body: dict, send, session_id: str|None = None) -> dict|None:
+        """
+        Executes a single JSON-RPC message, whatever transport it came from.
+
+        Args:
+            body: The JSON-RPC request or notification.
+            send: Coroutine function delivering notifications (e.g. tool progress) to the client.
+            session_id: The client session, if any, for requests referring to earlier ones.
+
+        Returns:
+            The JSON-RPC response, or None for notifications.
+        """
+        method = body.get("method")
+        params = body.get("params") or {}
+        request_id = body.get("id", None)
+        response = None
+        
+        try:
+            if method == "initialize":
+                protocol_version = params.get("protocolVersion")
+                response = {
+                    "jsonrpc": "2.0",
+                    "id": request_id,
+                    "result": {
+                        "protocolVersion": protocol_version if protocol_version in PROTOCOL_VERSIONS else PROTOCOL_VERSIONS[0],
+                        "capabilities": {
+                            "tools": {"listTools": True, "callTool": True},
+                            "resources": {}
+                        },
+                        "serverInfo": {"name": "PyMCP", "version": "1.0.0"}
+                    }
+                }
+            
+            elif method == "ping":
+                response = {"jsonrpc": "2.0", "id": request_id, "result": {}}
+            
+            elif method == "tools/list":
+                response = {
+                    "jsonrpc": "2.0",
+                    "id": request_id,
+                    "result": {"tools": [tool["tool_dict"] for tool in self.tools]}
+                }
+            
+            elif method == "tools/call":
+                tool_name = params.get("name")
+                arguments = params.get("arguments", {})
+                tool = next((tool for tool in self.tools if tool["tool_dict"]["name"] == tool_name), None)
+                
+                if tool:
+                    progress_token = (params.get("_meta") or {}).get("progressToken")
+                    response = await self.call_tool(tool, arguments, request_id, send, progress_token, session_id)
+                else:
+                    response = {
+                        "jsonrpc": "2.0",
+                        "id": request_id,
+                        "error": {"code": -32601, "message": f"Method '{tool_name}' not found"}
+                    }
+            
+            elif method == "notifications/cancelled":
+                # The cancelled request sends no response at all
+                if session_id:
+                    await self.cancel_request(session_id, params.get("requestId"))
+            
+            elif method == "resources/list":
+                response = {
+                    "jsonrpc": "2.0",
+                    "id": request_id,
+                    "result": {"resources": []}
+                }
+            
+            elif method == "resources/templates/list":
+                response = {
+                    "jsonrpc": "2.0",
+                    "id": request_id,
+                    "result": {"resourceTemplates": []}
+                }
+            
+            else:
+                response = {
+                    "jsonrpc": "2.0",
+                    "id": request_id,
+                    "error": {"code": -32601, "message": f"Method '{method}' not found"}
+                }
+        
+        except Exception as e:
+            response = {
+                "jsonrpc": "2.0",
+                "id": request_id,
+                "error": {"code": -32603, "message": f"Internal error processing method: {e}"}
+            }
+        
+        return response if request_id is not None else None
+
+
+    async def respond(self, body: dict, session_id: str):
+        send = functools.partial(self.send, session_id)
+        response = await self.handle_message(body, send, session_id)
+        if response is not None:
+            await send({"event": "message", "data": json.dumps(response)})
+
+
+    def start_call(self, coroutine, session_id: str|None, request_id=None):
+        """
+        Runs a request in the background, tracked so it is cancelled when its session closes
+        or when the client cancels its request id.
+        """
+        task = asyncio.create_task(coroutine)
+        self.running_calls.add(task)
+        task.add_done_callback(self.running_calls.discard)
+        if session_id:
+            calls = self.session_calls.setdefault(session_id, set())
+            calls.add(task)
+            task.add_done_callback(calls.discard)
+            if isinstance(request_id, (str, int)):
+                key = (session_id, request_id)
+                self.requests[key] = task
+                task.add_done_callback(lambda done: self.requests.pop(key) if self.requests.get(key) is done else None)
+        return task
+
+
+    async def cancel_request(self, session_id: str, request_id):
+        """
+        Cancels a running request, asking the other workers when it doesn't run on this one.
+        """
+        if not self.cancel_local_request(session_id, request_id):
+            await self.backend.publish_control({"type": "cancel", "session_id": session_id, "request_id": request_id})
+
+
+    def cancel_local_request(self, session_id: str, request_id) -> bool:
+        task = self.requests.get((session_id, request_id)) if isinstance(request_id, (str, int)) else None
+        if task is None:
+            return False
+        print(f"Cancelling request {request_id} of session {session_id}")
+        task.cancel()
+        return True
+
+
+    def run_in_background(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+
+
+    async def start(self):
+        await self.backend.start(self.deliver, self.apply_control)
+        self.session_sweeper = asyncio.create_task(self.sweep_sessions())
+
+
+    async def stop(self):
+        if self.session_sweeper:
+            self.session_sweeper.cancel()
+        await self.backend.aclose()
+
+
+    async def send(self, session_id: str, message: dict):
+        """
+        Sends a message to a session, through the backend when its stream is held by another worker.
+        """
+        session = self.sessions.get(session_id)
+        if session:
+            await session.send(message)
+        else:
+            await self.backend.publish(session_id, message)
+
+
+    async def deliver(self, session_id: str, message: dict):
+        session = self.sessions.get(session_id)
+        if session:
+            await session.send(message)
+
 
+    async def apply_control(self, command: dict):
+        if command.get("type") == "close":
+            self.close_local_session(command["session_id"])
+        elif command.get("type") == "cancel":
+            self.cancel_local_request(command["session_id"], command.get("request_id"))
 
-    def add_tool(self, tool_dict, tool_method):
-        self.tools.append({"tool_dict": tool_dict, "tool_method": tool_method})
+
+    def close_local_session(self, session_id: str):
+        """
+        Ends the stream of a session if this worker holds it and cancels the tool calls running here for it.
+        """
+        session = self.sessions.pop(session_id, None)
+        calls = self.session_calls.pop(session_id, set())
+        if session or calls:
+            print(f"Closing session {session_id}, cancelling {len([call for call in calls if not call.done()])} running tool calls")
+        if session:
+            session.close()
+        for task in calls:
+            task.cancel()
+
+
+    def close_session(self, session_id: str):
+        """
+        Closes a session on this worker and tells the other workers to cancel their tool calls for it.
+        """
+        self.close_local_session(session_id)
+        self.run_in_background(self.forget_session(session_id))
+
+
+    async def forget_session(self, session_id: str):
+        try:
+            await self.backend.remove_session(session_id)
+            await self.backend.unsubscribe(session_id)
+            await self.backend.publish_control({"type": "close", "session_id": session_id})
+        except Exception as e:
+            print(f"Failed to remove session {session_id} from the backend: {e}")
+
+
+    async def sweep_sessions(self):
+        while True:
+            await asyncio.sleep(min(self.backend.idle_ttl / 4, 60))
+            try:
+                await self.backend.prune()
+                alive = await self.backend.alive_sessions(list(self.sessions))
+            except Exception as e:
+                print(f"Failed to check sessions: {e}")
+                continue
+            for session in list(self.sessions.values()):
+                if session.closed.is_set() or session.id not in alive:
+                    self.close_session(session.id)
 
 
     async def sse_endpoint(self, request: Request):
         print(f"Endpoint /{self.endpoint}/sse called")
+        if len(self.sessions) >= self.max_sessions:
+            raise HTTPException(status_code=503, detail="Too many open sessions")
+        
         session_id = str(uuid.uuid4())
-        message_queue = asyncio.Queue()
-        self.active_sse_connections[session_id] = message_queue
+        session = Session(session_id, self.queue_size, self.queue_overflow)
+        self.sessions[session_id] = session
+        # Registered before the client learns the messages URL, so any worker accepts its first POST
+        await self.backend.add_session(session_id)
+        await self.backend.subscribe(session_id)
         
         forwarded_proto = request.headers.get("X-Forwarded-Proto")
         host = request.headers.get("Host")
@@ -48,149 +470,53 @@ class MCP:
         messages_url = f"{base_url}/{self.endpoint}/messages?session_id={session_id}"
         
         async def event_generator(messages_url):
-            message_queue = self.active_sse_connections.get(session_id)
-            if not message_queue:
-                return
-            
-            await asyncio.sleep(0.1)
-            
-            yield {
-                "event": "endpoint",
-                "data": str(messages_url)
-            }
-            
-            yield {"event": "ping", "data": "Server is alive!"}
-            
-            while True:
+            try:
+                await asyncio.sleep(0.1)
+                
+                yield {
+                    "event": "endpoint",
+                    "data": str(messages_url)
+                }
+                
+                yield {"event": "ping", "data": "Server is alive!"}
+                
+                closed = asyncio.create_task(session.closed.wait())
                 try:
-                    message = await asyncio.wait_for(message_queue.get(), timeout=30)
-                    yield message
-                except asyncio.TimeoutError:
-                    yield {"event": "ping", "data": "Server is alive!"}
-                except asyncio.CancelledError:
-                    break
-                except Exception as e:
-                    yield {"event": "error", "data": f"Server error: {e}"}
-                    break
+                    while not session.closed.is_set():
+                        try:
+                            message = asyncio.create_task(session.queue.get())
+                            done, _ = await asyncio.wait({message, closed}, timeout=30, return_when=asyncio.FIRST_COMPLETED)
+                            if message in done:
+                                yield message.result()
+                            else:
+                                message.cancel()
+                                if not done:
+                                    yield {"event": "ping", "data": "Server is alive!"}
+                        except asyncio.CancelledError:
+                            message.cancel()
+                            break
+                        except Exception as e:
+                            yield {"event": "error", "data": f"Server error: {e}"}
+                            break
+                finally:
+                    closed.cancel()
+            finally:
+                # Client went away (or the session was closed): free the queue and cancel running tool calls
+                self.close_session(session_id)
         
         return EventSourceResponse(event_generator(messages_url))
 
 
     async def post_handler(self, request: Request, session_id: str):
         print(f"Endpoint /{self.endpoint}/messages called for session_id: {session_id}")
-        message_queue = self.active_sse_connections.get(session_id)
-        if not message_queue:
+        if not await self.backend.touch_session(session_id):
             raise HTTPException(status_code=404, detail="Session not found")
         
         try:
             body = await request.json()
-            method = body.get("method")
-            params = body.get("params", {})
-            request_id = body.get("id", None)
-            response = None
-            error = None
-            
-            try:
-                if method == "initialize":
-                    response = {
-                        "jsonrpc": "2.0",
-                        "id": request_id,
-                        "result": {
-                            "protocolVersion": "2024-11-05",
-                            "capabilities": {
-                                "tools": {"listTools": True, "callTool": True},
-                                "resources": {}
-                            },
-                            "serverInfo": {"name": "PyMCP", "version": "1.0.0"}
-                        }
-                    }
-                
-                elif method == "tools/list":
-                    response = {
-                        "jsonrpc": "2.0",
-                        "id": request_id,
-                        "result": {"tools": [tool["tool_dict"] for tool in self.tools]}
-                    }
-                
-                elif method == "tools/call":
-                    tool_name = params.get("name")
-                    arguments = params.get("arguments", {})
-                    tool_result = None
-                    tool_method = None
-                    
-                    for tool in self.tools:
-                        if tool["tool_dict"]["name"] == tool_name:
-                            tool_method = tool["tool_method"]
-                            break
-                    
-                    if tool_method:
-                        try:
-                            tool_result = tool_method(**arguments)
-                        except Exception as e:
-                            error = {"code": -32603, "message": f"Internal error during tool execution: {e}"}
-                    else:
-                        error = {"code": -32601, "message": f"Method '{tool_name}' not found"}
-                    
-                    if error:
-                         response = {
-                            "jsonrpc": "2.0",
-                            "id": request_id,
-                            "error": error
-                        }
-                    else:
-                        response = {
-                            "jsonrpc": "2.0",
-                            "id": request_id,
-                            "result": {
-                                "content": [
-                                    {
-                                        "type": "text",
-                                        "text": tool_result or ""
-                                    }
-                                ]
-                            }
-                        }
-                
-                elif method == "resources/list":
-                    response = {
-                        "jsonrpc": "2.0",
-                        "id": request_id,
-                        "result": {"resources": []}
-                    }
-                
-                elif method == "resources/templates/list":
-                    response = {
-                        "jsonrpc": "2.0",
-                        "id": request_id,
-                        "result": {"resourceTemplates": []}
-                    }
-                
-                else:
-                    error = {"code": -32601, "message": f"Method '{method}' not found"}
-                    response = {
-                        "jsonrpc": "2.0",
-                        "id": request_id,
-                        "error": error
-                    }
-            
-            except Exception as e:
-                error = {"code": -32603, "message": f"Internal error processing method: {e}"}
-                response = {
-                    "jsonrpc": "2.0",
-                    "id": request_id,
-                    "error": error
-                }
-            
-            if response and request_id is not None:
-                sse_event = {
-                    "event": "message",
-                    "data": json.dumps(response)
-                }
-                await message_queue.put(sse_event)
-            elif response and request_id is None:
-                pass
-            
-            return JSONResponse({"status": "Message received and processed"})
+            # The response is delivered through the session stream once the request is processed
+            self.start_call(self.respond(body, session_id), session_id, body.get("id") if isinstance(body, dict) else None)
+            return JSONResponse({"status": "Message received"}, status_code=202)
         
         except json.JSONDecodeError:
             error_response = {
@@ -198,8 +524,7 @@ class MCP:
                 "id": None,
                 "error": {"code": -32700, "message": "Parse error: Invalid JSON was received by the server."}
             }
-            if message_queue:
-                 await message_queue.put({"event": "error", "data": json.dumps(error_response)})
+            await self.send(session_id, {"event": "error", "data": json.dumps(error_response)})
             return JSONResponse(error_response, status_code=400)
         except Exception as e:
             error_response = {
@@ -207,6 +532,100 @@ class MCP:
                 "id": None,
                 "error": {"code": -32603, "message": f"Internal error: {e}"}
             }
-            if message_queue:
-                 await message_queue.put({"event": "error", "data": json.dumps(error_response)})
+            await self.send(session_id, {"event": "error", "data": json.dumps(error_response)})
             return JSONResponse(error_response, status_code=500)
+
+
+    async def streamable_post(self, request: Request):
+        """
+        Streamable HTTP transport: the JSON-RPC response is returned in the POST response itself,
+        as plain JSON when ready within `inline_response_timeout`, or else as an SSE stream carrying
+        progress notifications and then the response.
+        """
+        session_id = request.headers.get(SESSION_HEADER)
+        if session_id and not await self.backend.touch_session(session_id):
+            raise HTTPException(status_code=404, detail="Session not found")
+        
+        try:
+            body = await request.json()
+        except json.JSONDecodeError:
+            error_response = {
+                "jsonrpc": "2.0",
+                "id": None,
+                "error": {"code": -32700, "message": "Parse error: Invalid JSON was received by the server."}
+            }
+            return JSONResponse(error_response, status_code=400)
+        
+        messages = body if isinstance(body, list) else [body]
+        requests = [message for message in messages if isinstance(message, dict) and message.get("method") and "id" in message]
+        notifications = [message for message in messages if isinstance(message, dict) and message.get("method") and "id" not in message]
+        
+        headers = {}
+        if not session_id and any(message["method"] == "initialize" for message in requests):
+            session_id = str(uuid.uuid4())
+            await self.backend.add_session(session_id)
+            headers[SESSION_HEADER] = session_id
+        
+        for notification in notifications:
+            await self.handle_message(notification, self.discard, session_id)
+        if not requests:
+            return Response(status_code=202, headers=headers)
+        
+        progress = asyncio.Queue()
+        tasks = [
+            self.start_call(self.handle_message(message, progress.put, session_id), session_id, message["id"])
+            for message in requests
+        ]
+        streaming = "text/event-stream" in request.headers.get("Accept", "")
+        done, pending = await asyncio.wait(tasks, timeout=self.inline_response_timeout if streaming else None)
+        
+        if not pending:
+            # Cancelled requests get no response
+            responses = [task.result() for task in tasks if not task.cancelled()]
+            if not responses:
+                return Response(status_code=202, headers=headers)
+            return JSONResponse(responses if isinstance(body, list) else responses[0], headers=headers)
+        
+        async def event_generator():
+            waiting = set(tasks)
+            try:
+                while waiting:
+                    message = asyncio.create_task(progress.get())
+                    done, _ = await asyncio.wait(waiting | {message}, return_when=asyncio.FIRST_COMPLETED)
+                    if message in done:
+                        yield message.result()
+                    else:
+                        message.cancel()
+                    while not progress.empty():
+                        yield progress.get_nowait()
+                    for task in done - {message}:
+                        waiting.discard(task)
+                        if not task.cancelled():
+                            yield {"event": "message", "data": json.dumps(task.result())}
+            finally:
+                # Client went away before all results were sent
+                for task in tasks:
+                    task.cancel()
+        
+        return EventSourceResponse(event_generator(), headers=headers)
+
+
+    async def streamable_get(self, request: Request):
+        # No server initiated messages, so there's no standalone stream to open
+        return Response(status_code=405, headers={"Allow": "POST, DELETE"})
+
+
+    async def streamable_delete(self, request: Request):
+        session_id = request.headers.get(SESSION_HEADER)
+        if not session_id:
+            raise HTTPException(status_code=400, detail=f"Missing {SESSION_HEADER} header")
+        if not await self.backend.touch_session(session_id):
+            raise HTTPException(status_code=404, detail="Session not found")
+        self.close_local_session(session_id)
+        await self.forget_session(session_id)
+        return Response(status_code=204)
+
+
+    @staticmethod
+    async def discard(message: dict):
+        pass
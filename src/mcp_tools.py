@@ -1,18 +1,35 @@
+import time
+import asyncio
 import logging
 from brave_api import BraveApi
-import concurrent.futures
+from http_client import HttpClient
 from page_loader import PageLoader
+from host_router import HostRouter
+from page_cache import PageCache, normalize_url
+from search_cache import SearchCache
 from llm import Assistant
+from ranking import rank_sections
+from markdown_sections import estimate_tokens, CHARS_PER_TOKEN
+from mcp import current_tool_call
+from prefetcher import Prefetcher
+from shared_task import SharedTask
+from document_store import DocumentStore
+from fetch_scheduler import FetchLane, SharedLane, fetch_lane, shared_lane
+from dedup import canonicalize_url, fingerprint, similarity
+from metrics import DUPLICATE_RESULTS
 
 
 class SearchTool:
 
-    def __init__(self, brave_api_key):
+    def __init__(self, brave_api_key, http_client: HttpClient|None = None, cache: SearchCache|None = None,
+                 prefetcher: Prefetcher|None = None, brave_api_url: str|None = None):
         self.api_key = brave_api_key
-        self.brave_api_instance = BraveApi(api_key=self.api_key)
+        self.brave_api_instance = BraveApi(api_key=self.api_key, http_client=http_client, cache=cache,
+                                           api_endpoint=brave_api_url)
+        self.prefetcher = prefetcher
 
 
-    def get_raw_results(self, query: str, count: int = 20) -> list[dict]:
+    async def get_raw_results(self, query: str, count: int = 20) -> list[dict]:
         """
         Args:
             query: The search query string.
@@ -24,7 +41,7 @@ class SearchTool:
         """
         
         try:
-            search_results = self.brave_api_instance.search(query, count=count)
+            search_results = await self.brave_api_instance.search(query, count=count)
         except Exception as e:
             logging.error(f"Error calling Brave API in SearchTool (get_raw_results): {e}")
             return []
@@ -36,9 +53,11 @@ class SearchTool:
         return search_results
 
 
-    def execute(self, query: str) -> str:
-        
-        raw_results = self.get_raw_results(query)
+    async def execute(self, query: str) -> str:
+        fetch_lane.set(FetchLane.INTERACTIVE)
+        raw_results = await self.get_raw_results(query)
+        if self.prefetcher:
+            self.prefetcher.submit([result.get('url') for result in raw_results if result.get('url', '').startswith(('http://', 'https://'))])
         
         markdown_results = "## Search Results:\n\n"
         for result in raw_results:
@@ -52,58 +71,347 @@ class SearchTool:
 
 class PrintPageTool:
 
-    def __init__(self, proxy: str|None = None):
+    def __init__(self, proxy: str|None = None, http_client: HttpClient|None = None,
+                 direct_timeout: float = 10, proxy_timeout: float = 30,
+                 hedge_delay: float = 2, router: HostRouter|None = None, cache: PageCache|None = None,
+                 max_bytes: int|None = 5 * 1024 * 1024, documents: DocumentStore|None = None,
+                 max_chars: int = 50000):
+        """
+        Args:
+            documents: Store of converted pages that `read` serves chunks from.
+            max_chars: Default size of the chunks returned by `read`.
+        """
         self.proxy = proxy
+        self.http_client = http_client
+        self.direct_timeout = direct_timeout
+        self.proxy_timeout = proxy_timeout
+        self.hedge_delay = hedge_delay
+        self.router = router or HostRouter()
+        self.cache = cache
+        self.max_bytes = max_bytes
+        self.documents = documents or DocumentStore()
+        self.max_chars = max_chars
+        self.in_flight = {}
 
-    def execute(self, url: str) -> str:
-        try:
-            page_loader = PageLoader(url, self.proxy)
-            markdown_content = page_loader.get_markdown()
+    async def execute(self, url: str, mode: str = "full") -> str:
+        markdown_content, _ = await self.load(url, mode)
+        return markdown_content
+
+    async def load(self, url: str, mode: str = "full") -> tuple[str|None, str|None]:
+        """
+        Returns:
+            The markdown of the page, or None and the reason it wasn't loaded when there is one to show.
+        """
+        # Concurrent requests for the same page (e.g. a prefetch and a print_page) share one load,
+        # which is cancelled when all of them are and fetches in the highest priority lane of them
+        key = PageCache.key(url, mode)
+        shared, lane = self.in_flight.get(key, (None, None))
+        if shared is None or not shared.joinable:
+            lane = SharedLane(fetch_lane.get())
+            shared = SharedTask(self._load_shared(lane, url, mode))
+            self.in_flight[key] = (shared, lane)
+            shared.add_done_callback(lambda done: self.in_flight.pop(key) if self.in_flight.get(key, (None,))[0] is done else None)
+        else:
+            lane.join(fetch_lane.get())
+        return await shared.join()
+
+    async def _load_shared(self, lane: SharedLane, url: str, mode: str) -> tuple[str|None, str|None]:
+        shared_lane.set(lane)
+        return await self._load(url, mode)
+
+    async def read(self, url: str, mode: str = "full", offset: int = 0, max_chars: int|None = None,
+                   section: str|None = None, cursor: str|None = None) -> str:
+        """
+        Returns a chunk of a page, the `print_page` tool. Pages longer than `max_chars` end with a note
+        holding the cursor of the next chunk, which is served from the document store.
+
+        Args:
+            offset: Character offset to start at, relative to the section when one is selected.
+            section: Text of a heading, only that section (up to the next heading of the same level) is returned.
+            cursor: Cursor from a previous chunk, continues where it ended. Overrides `offset` and `section`.
+        """
+        fetch_lane.set(FetchLane.INTERACTIVE)
+        max_chars = max(max_chars or self.max_chars, 1)
+        document = None
+        notes = []
+        end = None
+        if cursor:
+            try:
+                version, offset, end = cursor.split(":")
+                offset, end = int(offset), int(end)
+            except ValueError:
+                return f"Error: invalid cursor '{cursor}'."
+            document = self.documents.get(url, mode, version)
+        elif offset or section:
+            document = self.documents.get(url, mode)
+        
+        if document is None:
+            markdown_content, error = await self.load(url, mode)
+            if not markdown_content:
+                return f"*The page was not loaded: {error}.*" if error else markdown_content
+            document = self.documents.get(url, mode)
+            if document is None or document["markdown"] != markdown_content:
+                # Hashing and outlining a large page is CPU bound, keep it off the event loop
+                document = await asyncio.to_thread(self.documents.put, url, mode, markdown_content)
+            if cursor and document["version"] != version:
+                notes.append("the page changed since the cursor was issued, offsets may have shifted")
+        
+        markdown_content = document["markdown"]
+        start = 0
+        if section and not cursor:
+            heading = next((heading for heading in document["headings"] if section.lower() in heading["title"].lower()), None)
+            if heading is None:
+                titles = "\n".join(f"{'  ' * (heading['level'] - 1)}- {heading['title']}" for heading in document["headings"])
+                return f"Section '{section}' not found. Headings of the page:\n{titles}"
+            start, end = heading["start"], heading["end"]
+        end = min(end or len(markdown_content), len(markdown_content))
+        offset = min(start + max(offset, 0), end)
+        
+        stop = min(offset + max_chars, end)
+        if stop < end:
+            # Prefer cutting at a line break
+            line_end = markdown_content.rfind("\n", offset + max_chars // 2, stop)
+            if line_end > 0:
+                stop = line_end + 1
+        if offset == 0 and stop == len(markdown_content) and not notes:
+            return markdown_content
+        
+        notes.insert(0, f"characters {offset}-{stop} of {len(markdown_content)}")
+        if stop < end:
+            notes.append(f"next cursor: {document['version']}:{stop}:{end}")
+            if offset == start and not section and document["headings"]:
+                notes.append("sections: " + ", ".join(heading["title"] for heading in document["headings"][:50]))
+        else:
+            notes.append("end of section" if start or end < len(markdown_content) else "end of page")
+        return f"{markdown_content[offset:stop]}\n\n[{' | '.join(notes)}]"
 
+    async def _load(self, url: str, mode: str) -> tuple[str|None, str|None]:
+        try:
+            page_loader = PageLoader(url, self.proxy, self.http_client, self.direct_timeout, self.proxy_timeout,
+                                     self.hedge_delay, self.router, self.cache, mode, self.max_bytes)
+            markdown_content = await page_loader.get_markdown()
+            
             if markdown_content:
-                return markdown_content
+                return markdown_content, None
             logging.error(f"Error: Could not fetch or convert content from URL: {url}")
-            return None
+            return None, page_loader.error
         
         except Exception as e:
             logging.error(f"Error processing URL '{url}' in PrintPageTool: {e}")
-            return None
+            return None, None
+
+
+class PrintPagesTool:
+
+    def __init__(self, print_page_tool: PrintPageTool, max_parallel: int = 8,
+                 max_chars_per_page: int = 20000, max_total_chars: int = 100000):
+        """
+        Args:
+            print_page_tool: Tool used to fetch and convert every page.
+            max_parallel: Number of pages fetched and converted at the same time.
+            max_chars_per_page: Default cap of the content returned per page.
+            max_total_chars: Default cap of the content returned for all pages together.
+        """
+        self.print_page_tool = print_page_tool
+        self.max_parallel = max_parallel
+        self.max_chars_per_page = max_chars_per_page
+        self.max_total_chars = max_total_chars
+
+    async def _load(self, url: str, mode: str, semaphore: asyncio.Semaphore) -> dict:
+        async with semaphore:
+            start = time.monotonic()
+            markdown_content, error = await self.print_page_tool.load(url, mode)
+            return {
+                "url": url,
+                "content": markdown_content or "",
+                "status": "ok" if markdown_content else "error",
+                "error": error,
+                "elapsed": time.monotonic() - start,
+            }
+
+    async def execute(self, urls: list[str], mode: str = "full", max_chars_per_page: int|None = None,
+                      max_total_chars: int|None = None) -> str:
+        fetch_lane.set(FetchLane.INTERACTIVE)
+        max_chars_per_page = max_chars_per_page or self.max_chars_per_page
+        remaining = max_total_chars or self.max_total_chars
+        
+        unique_urls = {}
+        for url in urls:
+            unique_urls.setdefault(normalize_url(url), url)
+        semaphore = asyncio.Semaphore(self.max_parallel)
+        pages = await asyncio.gather(*(self._load(url, mode, semaphore) for url in unique_urls.values()))
+        
+        page_outputs = []
+        for page in pages:
+            content = page["content"]
+            limit = min(max_chars_per_page, remaining)
+            notes = [page["status"], f"{page['elapsed']:.2f}s", f"{len(content)} chars"]
+            if page["error"]:
+                notes.append(page["error"])
+            if page["status"] == "ok" and limit <= 0:
+                notes.append("omitted, total size limit reached")
+                content = ""
+            elif len(content) > limit:
+                notes.append(f"truncated to {limit} chars")
+                content = content[:limit]
+            remaining -= len(content)
+            page_outputs.append(f"# {page['url']}\n[{' | '.join(notes)}]\n\n{content}\n\n################\n\n")
+        
+        return "".join(page_outputs).strip()
 
 
 class SearchAndPrintPageTool:
-    def __init__(self, api_key, api_url, model_name, brave_api_key, proxy: str|None = None):
+    def __init__(self, api_key, api_url, model_name, brave_api_key, proxy: str|None = None,
+                 print_page_tool: PrintPageTool|None = None, search_tool: SearchTool|None = None,
+                 page_mode: str = "article", assistant: Assistant|None = None,
+                 prefilter_tokens: int = 8000, top_sections: int = 3, deadline: float|None = None,
+                 target_pages: int = 4, candidates: int = 10, max_parallel: int = 4, token_budget: int|None = None,
+                 duplicate_similarity: float|None = 0.7):
+        """
+        Without LLM settings (or an assistant) pages are trimmed with local BM25 ranking only.
+
+        Args:
+            prefilter_tokens: Pages longer than this are reduced to their best matching sections before the LLM call.
+            top_sections: Number of sections returned when trimming without the LLM.
+            deadline: Default overall deadline in seconds, None to wait for every page.
+            target_pages: Number of pages with relevant content to collect, processing stops once reached.
+            candidates: Number of search results requested, later ones replace failed or irrelevant pages.
+            max_parallel: Number of pages processed at the same time.
+            token_budget: Optional budget of page tokens sent to the LLM per call, no new page is started once spent.
+            duplicate_similarity: Pages whose content is at least this similar to an already processed page
+                are skipped before trimming, None to only skip duplicate URLs.
+        """
         
-        self.search_tool = SearchTool(brave_api_key=brave_api_key)
-        self.print_page_tool = PrintPageTool(proxy)
-        self.assistant = Assistant(api_key, api_url, model_name)
+        self.search_tool = search_tool or SearchTool(brave_api_key=brave_api_key)
+        self.print_page_tool = print_page_tool or PrintPageTool(proxy)
+        self.assistant = assistant or (Assistant(api_key, api_url, model_name) if api_key and model_name else None)
+        self.page_mode = page_mode
+        self.prefilter_tokens = prefilter_tokens
+        self.top_sections = top_sections
+        self.deadline = deadline
+        self.target_pages = target_pages
+        self.candidates = max(candidates, target_pages)
+        self.max_parallel = max_parallel
+        self.token_budget = token_budget
+        self.duplicate_similarity = duplicate_similarity
+    
+    async def _trim(self, topic: str, content: str|None, trim: str) -> tuple[str, int]:
+        """
+        Returns:
+            The trimmed content and the number of content tokens sent to the LLM.
+        """
+        if not content:
+            return '', 0
+        
+        if trim == "llm" and self.assistant:
+            if estimate_tokens(content) > self.prefilter_tokens:
+                # Without any matching section, the beginning of the page is the best guess
+                content = (await asyncio.to_thread(rank_sections, content, topic, max_tokens=self.prefilter_tokens)
+                           or content[:self.prefilter_tokens * CHARS_PER_TOKEN])
+            tokens = min(estimate_tokens(content), self.assistant.max_page_tokens)
+            trimmed_content = await self.assistant.context_trim(topic, content)
+            if trimmed_content is not None:
+                return trimmed_content, tokens
+            logging.warning("LLM trim failed, falling back to local ranking.")
+            return await asyncio.to_thread(rank_sections, content, topic, top_k=self.top_sections), tokens
+        
+        return await asyncio.to_thread(rank_sections, content, topic, top_k=self.top_sections), 0
+    
+    @staticmethod
+    def _format_page(result_info, content: str) -> str:
+        return f"# {result_info['title']}\n[{result_info['url']}]\n\n{content}\n\n################\n\n"
     
-    def _process_result_sync(self, result_info, query, context):
+    async def _process_result(self, result_info, query, context, trim, fingerprints: dict) -> tuple[str, int]:
+        """
+        Args:
+            fingerprints: Content fingerprints of the pages processed by this call so far, by URL.
+        """
         url = result_info['url']
-        title = result_info['title']
         
-        prettified_content = self.print_page_tool.execute(url)
+        prettified_content = await self.print_page_tool.execute(url, self.page_mode)
+        
+        if prettified_content and self.duplicate_similarity is not None:
+            page_fingerprint = await asyncio.to_thread(fingerprint, prettified_content)
+            # No await between the check and the registration, so only one of concurrent copies gets through
+            for other_url, other_fingerprint in fingerprints.items():
+                if similarity(page_fingerprint, other_fingerprint) >= self.duplicate_similarity:
+                    logging.info(f"Skipping {url}: duplicate content of {other_url}")
+                    DUPLICATE_RESULTS.inc(kind="content")
+                    return '', 0
+            fingerprints[url] = page_fingerprint
         
-        trimmed_content = self.assistant.context_trim(f'{query}: {context}', prettified_content) or ''
-        return f"# {title}\n[{url}]\n\n{trimmed_content}\n\n################\n\n"
+        return await self._trim(f'{query}: {context}', prettified_content, trim)
     
-    def execute(self, query: str, context: str) -> str:
-        search_results_list = self.search_tool.get_raw_results(query, 4)
-        page_outputs = [""] * len(search_results_list)
-        
-        with concurrent.futures.ThreadPoolExecutor(max_workers=None) as executor:
-            future_to_index = {
-                executor.submit(self._process_result_sync, result_info, query, context): i
-                for i, result_info in enumerate(search_results_list)
-            }
-            
-            for future in concurrent.futures.as_completed(future_to_index):
-                index = future_to_index[future]
-                try:
-                    page_outputs[index] = future.result()
-                except Exception as exc:
-                    logging.error(f"Result {index} generated an exception: {exc}")
-                    url = search_results_list[index]['url']
-                    title = search_results_list[index]['title']
-                    page_outputs[index] = f"# {title}\n[{url}]\n\n\n\n################\n\n"
+    async def execute(self, query: str, context: str, trim: str|None = None, deadline: float|None = None) -> str:
+        """
+        Search results are processed in rank order, `max_parallel` at a time. Results pointing at a variant of
+        an earlier result's URL are dropped, pages duplicating the content of an earlier page are not trimmed.
+        Pages that fail to load, duplicate others or have no relevant content are replaced by the next candidate,
+        until `target_pages` relevant pages are collected, the candidates or the token budget run out, or `deadline`
+        seconds passed. Work still running then is cancelled, pages cut by the deadline are marked as timed out.
+        Each relevant page is sent as a progress notification when the client asked for progress.
+        """
+        fetch_lane.set(FetchLane.SEARCH)
+        trim = trim or ("llm" if self.assistant else "bm25")
+        deadline = deadline or self.deadline
+        tool_call = current_tool_call.get()
+        search_results_list = []
+        seen_urls = set()
+        for result_info in await self.search_tool.get_raw_results(query, self.candidates):
+            canonical_url = canonicalize_url(result_info['url'])
+            if canonical_url in seen_urls:
+                logging.info(f"Skipping {result_info['url']}: duplicate URL")
+                DUPLICATE_RESULTS.inc(kind="url")
+                continue
+            seen_urls.add(canonical_url)
+            search_results_list.append(result_info)
         
-        return "".join(page_outputs).strip()
+        candidates = iter(enumerate(search_results_list))
+        fingerprints = {}
+        running = {}
+        page_outputs = {}
+        tokens_spent = 0
+        loop = asyncio.get_running_loop()
+        end_time = loop.time() + deadline if deadline else None
+        
+        def launch():
+            while len(running) < self.max_parallel and len(page_outputs) < self.target_pages:
+                if self.token_budget is not None and tokens_spent >= self.token_budget:
+                    return
+                index, result_info = next(candidates, (None, None))
+                if result_info is None:
+                    return
+                running[asyncio.create_task(self._process_result(result_info, query, context, trim, fingerprints))] = index
+        
+        try:
+            launch()
+            while running and len(page_outputs) < self.target_pages:
+                timeout = end_time - loop.time() if end_time else None
+                if timeout is not None and timeout <= 0:
+                    break
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    index = running.pop(task)
+                    if task.exception():
+                        logging.error(f"Result {index} generated an exception: {task.exception()}")
+                        continue
+                    trimmed_content, tokens = task.result()
+                    tokens_spent += tokens
+                    if not trimmed_content.strip():
+                        logging.info(f"Result {index} has no relevant content, trying the next candidate: {search_results_list[index]['url']}")
+                        continue
+                    page_outputs[index] = self._format_page(search_results_list[index], trimmed_content)
+                    if tool_call:
+                        await tool_call.report_progress(len(page_outputs), self.target_pages, page_outputs[index].strip())
+                launch()
+        finally:
+            for task in running:
+                task.cancel()
+        
+        # Pages cut by the deadline are listed while there's room, so the agent can retry them
+        if end_time and loop.time() >= end_time:
+            for index in sorted(running.values())[:self.target_pages - len(page_outputs)]:
+                logging.info(f"Result {index} timed out after {deadline}s: {search_results_list[index]['url']}")
+                page_outputs[index] = self._format_page(search_results_list[index], f"*Timed out after {deadline} seconds.*")
+        
+        return "".join(page_outputs[index] for index in sorted(page_outputs)).strip()
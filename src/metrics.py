@@ -0,0 +1,218 @@
+import math
+import time
+import asyncio
+import threading
+import contextlib
+import contextvars
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+REGISTRY = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Metric:
+    """
+    A metric family in the Prometheus text format, with samples per label values.
+    Label values are passed as keyword arguments, e.g. `COUNTER.inc(stage="brave")`.
+    Updates are thread-safe, since blocking tools record from worker threads.
+    """
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.values = {}
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: tuple, extra: dict|None = None) -> str:
+        pairs = list(zip(self.labelnames, key)) + list((extra or {}).items())
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def samples(self) -> list[str]:
+        with self.lock:
+            return [f"{self.name}{self._labels(key)} {_format_value(value)}" for key, value in self.values.items()]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"] + self.samples()
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    A value that goes up and down. Without labels it can read its value from a function at scrape time.
+    """
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, help, labelnames)
+        self.function = None
+
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function):
+        self.function = function
+
+    def samples(self) -> list[str]:
+        if self.function:
+            return [f"{self.name} {_format_value(self.function())}"]
+        return super().samples()
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.values[key] = (counts, total + value)
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> list[str]:
+        lines = []
+        with self.lock:
+            for key, (counts, total) in self.values.items():
+                for bound, count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{self._labels(key, {'le': _format_value(bound)})} {count}")
+                lines.append(f"{self.name}_sum{self._labels(key)} {total!r}")
+                lines.append(f"{self.name}_count{self._labels(key)} {counts[-1]}")
+        return lines
+
+
+def render() -> str:
+    """
+    Returns:
+        All registered metrics in the Prometheus text exposition format.
+    """
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+TOOL_SECONDS = Histogram("mcp_tool_duration_seconds", "Duration of tool calls.", ("tool",))
+TOOL_CALLS = Counter("mcp_tool_calls_total", "Tool calls by outcome.", ("tool", "status"))
+STAGE_SECONDS = Histogram("mcp_stage_duration_seconds", "Duration of the stages tool calls are made of.", ("stage",))
+STAGE_ERRORS = Counter("mcp_stage_errors_total", "Stages that failed with an error.", ("stage",))
+CACHE_REQUESTS = Counter("mcp_cache_requests_total", "Cache lookups by result (hit, miss, revalidated, shared).", ("cache", "result"))
+PROXY_FETCHES = Counter("mcp_proxy_fetches_total", "Fetches sent through the proxy, by reason.", ("reason",))
+BYTES_DOWNLOADED = Counter("mcp_downloaded_bytes_total", "Bytes of page bodies downloaded.")
+DUPLICATE_RESULTS = Counter("mcp_duplicate_results_total", "Search results skipped as duplicates, by kind (url, content).", ("kind",))
+LLM_TOKENS = Counter("mcp_llm_tokens_total", "LLM tokens sent (prompt) and received (completion).", ("direction",))
+SESSIONS = Gauge("mcp_sessions", "Open SSE sessions held by this worker.")
+SESSION_QUEUE_MESSAGES = Gauge("mcp_session_queue_messages", "Messages waiting in the SSE session queues.")
+RUNNING_CALLS = Gauge("mcp_running_calls", "Requests being processed.")
+FETCH_IN_FLIGHT = Gauge("mcp_fetch_in_flight", "Outgoing requests holding a fetch scheduler slot.")
+FETCH_WAITING = Gauge("mcp_fetch_waiting", "Outgoing requests waiting for a fetch scheduler slot, by lane.", ("lane",))
+PREFETCH_QUEUE_URLS = Gauge("mcp_prefetch_queue_urls", "URLs waiting to be prefetched.")
+
+
+class Trace:
+    """
+    Breakdown of the time a single request spent in each stage, for debugging.
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.events = []
+        self.lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float, status: str = "ok"):
+        with self.lock:
+            self.events.append((stage, time.perf_counter() - self.started - seconds, seconds, status))
+
+    def summary(self) -> dict:
+        """
+        Returns:
+            The total time, the time per stage (stages may overlap when run concurrently) and every stage
+            as `[stage, start offset, duration, status]`, all in seconds.
+        """
+        with self.lock:
+            events = sorted(self.events, key=lambda event: event[1])
+        stages = {}
+        for stage, _, seconds, _ in events:
+            totals = stages.setdefault(stage, {"count": 0, "seconds": 0.0})
+            totals["count"] += 1
+            totals["seconds"] = round(totals["seconds"] + seconds, 4)
+        return {
+            "total": round(time.perf_counter() - self.started, 4),
+            "stages": stages,
+            "events": [[stage, round(offset, 4), round(seconds, 4), status] for stage, offset, seconds, status in events],
+        }
+
+
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+@contextlib.contextmanager
+def stage(name: str):
+    """
+    Times a stage into `STAGE_SECONDS` and the trace of the current request, if any.
+    Cancelled stages (e.g. the losing side of a hedged fetch) are not recorded.
+    """
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except asyncio.CancelledError:
+        status = None
+        raise
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        if status:
+            seconds = time.perf_counter() - started
+            STAGE_SECONDS.observe(seconds, stage=name)
+            if status == "error":
+                STAGE_ERRORS.inc(stage=name)
+            trace = current_trace.get()
+            if trace:
+                trace.add(name, seconds, status)
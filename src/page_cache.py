@@ -0,0 +1,121 @@
+import time
+import asyncio
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from cache import LRUCache, SqliteStore
+
+
+def normalize_url(url: str) -> str:
+    """
+    Normalizes a URL for use as a cache key: lowercase scheme and host, no default port,
+    no fragment, sorted query parameters.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != {"http": 80, "https": 443}.get(scheme):
+        host = f"{host}:{parts.port}"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, parts.path or "/", query, ""))
+
+
+def entry_size(entry: dict) -> int:
+    return len(entry["markdown"]) + 256
+
+
+class PageCache:
+    """
+    Two-tier cache of converted pages, keyed by normalized URL.
+    Entries hold the converted markdown along with the response metadata (validators, content type),
+    so expired entries can be revalidated with a conditional request instead of refetched.
+    The memory tier is an LRU bounded by bytes, the optional disk tier is SQLite and survives restarts.
+    """
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: float = 300,
+                 path: str|None = None, max_disk_bytes: int = 512 * 1024 * 1024):
+        """
+        Args:
+            max_bytes: Size bound of the memory tier.
+            ttl: Seconds an entry is served without revalidation.
+            path: Path of the SQLite database for the disk tier, None to keep the cache in memory only.
+            max_disk_bytes: Size bound of the disk tier.
+        """
+        self.ttl = ttl
+        self.memory = LRUCache(max_bytes, sizeof=entry_size)
+        self.disk = SqliteStore(path, max_disk_bytes, table="pages") if path else None
+
+    @staticmethod
+    def key(url: str, variant: str = "") -> str:
+        # Fragments are dropped by normalization, so the variant can't collide with a real URL
+        return normalize_url(url) + (f"#{variant}" if variant else "")
+
+    def is_fresh(self, entry: dict) -> bool:
+        return entry["expires_at"] > time.time()
+
+    @staticmethod
+    def conditional_headers(entry: dict) -> dict:
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    async def get(self, url: str, variant: str = "") -> dict|None:
+        """
+        Args:
+            url: The requested URL.
+            variant: Conversion variant of the page, e.g. the extraction mode.
+
+        Returns:
+            The cached entry (possibly expired, check with `is_fresh`), or None.
+        """
+        key = self.key(url, variant)
+        entry = self.memory.get(key)
+        if entry is None and self.disk:
+            entry = await asyncio.to_thread(self.disk.get, key)
+            if entry is not None:
+                self.memory.set(key, entry)
+        return entry
+
+    async def put(self, url: str, markdown: str, headers, variant: str = "") -> dict|None:
+        """
+        Stores a converted page together with the metadata of its response.
+
+        Args:
+            url: The requested URL.
+            markdown: The converted content.
+            headers: Response headers, used for validators and `Cache-Control: no-store`.
+            variant: Conversion variant of the page, e.g. the extraction mode.
+
+        Returns:
+            The stored entry, or None when the response must not be cached.
+        """
+        if "no-store" in headers.get("cache-control", "").lower():
+            return None
+        
+        entry = {
+            "url": url,
+            "variant": variant,
+            "markdown": markdown,
+            "etag": headers.get("etag"),
+            "last_modified": headers.get("last-modified"),
+            "content_type": headers.get("content-type"),
+            "content_length": headers.get("content-length"),
+            "fetched_at": time.time(),
+            "expires_at": time.time() + self.ttl,
+        }
+        await self._store(entry)
+        return entry
+
+    async def refresh(self, entry: dict) -> dict:
+        """
+        Marks an entry as fresh again after a `304 Not Modified` revalidation.
+        """
+        entry = dict(entry, expires_at=time.time() + self.ttl)
+        await self._store(entry)
+        return entry
+
+    async def _store(self, entry: dict):
+        key = self.key(entry["url"], entry["variant"])
+        self.memory.set(key, entry)
+        if self.disk:
+            await asyncio.to_thread(self.disk.set, key, entry)
@@ -1,78 +1,218 @@
-import requests
-from markdownify import markdownify as md
+import asyncio
+import functools
+import httpx
 from urllib.parse import quote
+from http_client import HttpClient, FetchedResponse, UnsupportedContent, get_default_client
+from host_router import HostRouter, HostRoute, is_host_failure
+from page_cache import PageCache
+from content_extractor import document_to_markdown, is_supported
+from metrics import stage, CACHE_REQUESTS, PROXY_FETCHES
+
+
+class PageUnavailable(Exception):
+    """
+    Raised when the server answers for the URL itself with an error status (e.g. `404 Not Found`),
+    which neither the proxy nor another attempt would change.
+    """
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP status {status_code}")
+        self.status_code = status_code
+
 
 class PageLoader:
     """
     A class to fetch the content of a URL and convert it to Markdown.
     """
-    def __init__(self, url: str, proxy: str|None = None):
+    def __init__(self, url: str, proxy: str|None = None, http_client: HttpClient|None = None,
+                 direct_timeout: float = 10, proxy_timeout: float = 30,
+                 hedge_delay: float = 2, router: HostRouter|None = None, cache: PageCache|None = None,
+                 mode: str = "full", max_bytes: int|None = 5 * 1024 * 1024):
         """
         Initializes the PageLoader with a URL.
 
         Args:
             url: The URL of the page to load.
+            proxy: Optional proxy accepting `?url=` GET requests, used when the direct fetch fails.
+            http_client: Pooled client to fetch with, defaults to the process-wide one.
+            direct_timeout: Timeout of the direct fetch in seconds.
+            proxy_timeout: Timeout of the proxy fetch in seconds.
+            hedge_delay: Seconds to wait for the direct fetch before racing it against the proxy.
+            router: Optional per-host routing table, updated with the fetch results.
+            cache: Optional page cache, expired entries are revalidated with conditional requests.
+            mode: Extraction mode, see `content_extractor.html_to_markdown`.
+            max_bytes: Download size cap, longer documents are converted from their truncated beginning.
         """
         if not url.startswith(('http://', 'https://')):
             raise ValueError("Invalid URL format. URL must start with http:// or https://")
         
         self.proxy = proxy
         self.url = url
+        self.http_client = http_client or get_default_client()
+        self.direct_timeout = direct_timeout
+        self.proxy_timeout = proxy_timeout
+        self.hedge_delay = hedge_delay
+        self.router = router
+        self.cache = cache
+        self.mode = mode
+        self.max_bytes = max_bytes
         
-        self.html_content = None
+        self.response = None
         self.markdown_content = None
+        # Why the page wasn't loaded, when the reason is worth showing (rejected content, error status)
+        self.error = None
 
-    def __fetch_html(self, proxy = False) -> str | None:
+    async def __fetch_html(self, proxy = False, headers: dict|None = None) -> FetchedResponse | None:
         """
         Fetches the HTML content from the URL.
 
+        Args:
+            proxy: Whether to fetch through the proxy.
+            headers: Extra request headers, e.g. validators for a conditional request.
+
         Returns:
-            The HTML content as a string, or None if the request fails.
+            The successful (or `304 Not Modified`) response, or None if the request fails.
+
+        Raises:
+            UnsupportedContent: When the headers show a document type that can't be converted.
+            PageUnavailable: When the status is an error of the URL, not of the host.
         """
         
+        accept = functools.partial(is_supported, max_bytes=self.max_bytes)
         try:
             if proxy:
                 print(f'Using proxy: {self.proxy} for request')
-                response = requests.get(self.proxy + '?url=' + quote(self.url), timeout=30)
+                with stage("fetch_proxy"):
+                    return await self.http_client.fetch(self.proxy + '?url=' + quote(self.url), timeout=self.proxy_timeout,
+                                                        max_bytes=self.max_bytes, accept=accept, headers=headers)
             else:
-                response = requests.get(self.url, timeout=10)
-            response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
-            self.html_content = response.text
-            return self.html_content
-        except requests.exceptions.RequestException as e:
+                with stage("fetch_direct"):
+                    return await self.http_client.fetch(self.url, timeout=self.direct_timeout,
+                                                        max_bytes=self.max_bytes, accept=accept, headers=headers)
+        except httpx.HTTPStatusError as e:
             print(f"Error fetching URL {self.url}: {e}")
-            self.html_content = None
+            if not is_host_failure(e.response.status_code):
+                raise PageUnavailable(e.response.status_code)
+            return None
+        except httpx.HTTPError as e:
+            print(f"Error fetching URL {self.url}: {e}")
+            return None
+
+    async def __fetch_hedged(self, headers: dict|None = None) -> FetchedResponse | None:
+        """
+        Fetches the HTML content directly and through the proxy, whichever succeeds first.
+        The proxy fetch starts after `hedge_delay` seconds, as soon as the direct fetch fails,
+        or right away when the router knows the host needs the proxy.
+
+        Args:
+            headers: Extra request headers sent on both paths.
+
+        Returns:
+            The first successful response, or None if every path fails.
+
+        Raises:
+            UnsupportedContent, PageUnavailable: From the first path answering with them, the router isn't updated.
+        """
+        route = self.router.route(self.url) if self.router else HostRoute.DIRECT
+        if route == HostRoute.BLOCKED:
+            print(f"Skipping {self.url}: host is failing on all paths, cooling down")
             return None
+        
+        tasks = {}
+        outcome = {"direct": None, "proxy": None}
+        response = None
+        try:
+            if route == HostRoute.DIRECT or not self.proxy:
+                tasks[asyncio.create_task(self.__fetch_html(headers=headers))] = "direct"
+                if self.proxy:
+                    await asyncio.wait(tasks, timeout=self.hedge_delay)
+            
+            while True:
+                for task in [task for task in tasks if task.done()]:
+                    result = task.result()
+                    outcome[tasks.pop(task)] = result is not None
+                    response = response or result
+                if response or (not tasks and (outcome["proxy"] is not None or not self.proxy)):
+                    break
+                if self.proxy and outcome["proxy"] is None and "proxy" not in tasks.values():
+                    if route == HostRoute.PROXY:
+                        PROXY_FETCHES.inc(reason="routed")
+                    else:
+                        PROXY_FETCHES.inc(reason="direct_failed" if outcome["direct"] is False else "hedge")
+                    tasks[asyncio.create_task(self.__fetch_html(proxy=True, headers=headers))] = "proxy"
+                await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task, path in tasks.items():
+                task.cancel()
+                # The direct fetch lost the race against a proxy started after it, treat as too slow
+                if path == "direct" and outcome["proxy"]:
+                    outcome["direct"] = False
+        
+        if self.router:
+            self.router.record(self.url, outcome["direct"], outcome["proxy"])
+        return response
 
-    def __convert_to_markdown(self) -> str | None:
+    async def __convert_to_markdown(self) -> str | None:
         """
-        Converts the fetched HTML content to Markdown.
+        Converts the fetched content to Markdown, with the extractor matching its content type.
 
         Returns:
-            The Markdown content as a string, or None if HTML content is not available.
+            The Markdown content as a string, or None if the content is not available.
         """
-        if self.html_content is None:
-            print("HTML content not fetched yet. Call __fetch_html() first.")
+        if self.response is None:
+            print("Content not fetched yet. Call __fetch_html() first.")
             return None
 
         try:
-            self.markdown_content = md(self.html_content)
+            # Parsing and conversion are CPU bound, keep them off the event loop
+            with stage("convert"):
+                self.markdown_content = await asyncio.to_thread(
+                    document_to_markdown, self.response.content, self.response.content_type,
+                    self.response.encoding, self.mode, self.response.truncated
+                )
             return self.markdown_content
         except Exception as e:
-            print(f"Error converting HTML to Markdown: {e}")
+            print(f"Error converting content to Markdown: {e}")
             self.markdown_content = None
             return None
 
-    def get_markdown(self) -> str | None:
+    async def get_markdown(self) -> str | None:
         """
         Fetches the HTML content and converts it to Markdown.
+        With a cache, fresh entries are returned directly and expired ones are revalidated,
+        a `304 Not Modified` answer skips both the download and the conversion.
 
         Returns:
-            The Markdown content as a string, or None if any step fails.
+            The Markdown content as a string, or None if any step fails (see `error` for the reason).
         """
-        if self.__fetch_html():
-            return self.__convert_to_markdown()
-        elif self.__fetch_html(proxy=True):
-            return self.__convert_to_markdown()
-        else:
+        entry = await self.cache.get(self.url, self.mode) if self.cache else None
+        if entry and self.cache.is_fresh(entry):
+            CACHE_REQUESTS.inc(cache="page", result="hit")
+            self.markdown_content = entry["markdown"]
+            return self.markdown_content
+        
+        try:
+            response = await self.__fetch_hedged(PageCache.conditional_headers(entry) if entry else None)
+        except (UnsupportedContent, PageUnavailable) as e:
+            print(f"Not loading {self.url}: {e}")
+            self.error = str(e)
+            return None
+        if response is None:
+            return None
+        
+        if response.status_code == 304:
+            if entry:
+                CACHE_REQUESTS.inc(cache="page", result="revalidated")
+                await self.cache.refresh(entry)
+                self.markdown_content = entry["markdown"]
+                return self.markdown_content
+            return None
+        
+        if self.cache:
+            CACHE_REQUESTS.inc(cache="page", result="miss")
+        self.response = response
+        if await self.__convert_to_markdown() is None:
             return None
+        # Empty conversions may be an extraction miss, don't keep them for the whole TTL
+        if self.cache and self.markdown_content.strip():
+            await self.cache.put(self.url, self.markdown_content, response.headers, self.mode)
+        return self.markdown_content
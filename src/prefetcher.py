@@ -0,0 +1,62 @@
+import asyncio
+import logging
+import contextvars
+from metrics import PREFETCH_QUEUE_URLS
+from fetch_scheduler import FetchLane, fetch_lane
+
+
+class Prefetcher:
+    """
+    Background loader of search result pages into the page cache.
+    URLs are queued in a bounded queue (new URLs are dropped when it is full) and loaded by
+    a few low-priority workers, so a later `print_page` is served from memory or joins the
+    fetch already in flight.
+    """
+    def __init__(self, print_page_tool, top_n: int = 3, queue_size: int = 32, workers: int = 2, mode: str = "full"):
+        """
+        Args:
+            print_page_tool: Tool used to load the pages, its cache stores the results.
+            top_n: Number of leading search results prefetched per search.
+            queue_size: Number of URLs waiting to be prefetched at most.
+            workers: Number of pages prefetched at the same time.
+            mode: Extraction mode the pages are prefetched in.
+        """
+        self.print_page_tool = print_page_tool
+        self.top_n = top_n
+        self.queue_size = queue_size
+        self.worker_count = workers
+        self.mode = mode
+        self.queue = None
+        self.workers = []
+        PREFETCH_QUEUE_URLS.set_function(lambda: self.queue.qsize() if self.queue else 0)
+
+    def submit(self, urls: list[str]):
+        if self.queue is None:
+            self.queue = asyncio.Queue(maxsize=self.queue_size)
+            # Fresh context, so prefetches aren't traced as part of the search that started the workers
+            self.workers = [asyncio.create_task(self._worker(), context=contextvars.Context()) for _ in range(self.worker_count)]
+        
+        for url in urls[:self.top_n]:
+            try:
+                self.queue.put_nowait(url)
+            except asyncio.QueueFull:
+                logging.info(f"Prefetch queue full, dropping {url}")
+                break
+
+    async def _worker(self):
+        fetch_lane.set(FetchLane.BULK)
+        while True:
+            url = await self.queue.get()
+            try:
+                await self.print_page_tool.execute(url, self.mode)
+            except Exception as e:
+                logging.error(f"Error prefetching URL '{url}': {e}")
+            finally:
+                self.queue.task_done()
+
+    async def aclose(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        self.queue = None
@@ -0,0 +1,83 @@
+import re
+import math
+from collections import Counter, defaultdict
+from markdown_sections import pack_windows, split_long_lines, estimate_tokens
+
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have how in is it its of on or that the this to was were what when where which who why will with
+""".split())
+
+
+def tokenize(text: str) -> list[str]:
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    In-memory inverted index over a small set of documents, scored with Okapi BM25.
+    """
+    def __init__(self, documents: list[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(dict)
+        self.lengths = []
+        for doc_id, document in enumerate(documents):
+            terms = Counter(tokenize(document))
+            self.lengths.append(sum(terms.values()))
+            for term, frequency in terms.items():
+                self.postings[term][doc_id] = frequency
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0
+
+    def scores(self, query: str) -> list[float]:
+        """
+        Returns:
+            The BM25 score of every document for the query, in document order.
+        """
+        scores = [0.0] * len(self.lengths)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (len(self.lengths) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, frequency in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / (self.average_length or 1))
+                scores[doc_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return scores
+
+
+def rank_sections(content: str, query: str, top_k: int|None = None, max_tokens: int|None = None,
+                  section_tokens: int = 600) -> str:
+    """
+    Keeps the sections of a markdown document that best match the query.
+
+    Args:
+        content: The markdown content.
+        query: The text the sections are scored against.
+        top_k: Maximum number of sections to keep.
+        max_tokens: Token budget of the kept sections.
+        section_tokens: Sections are cut on headings into passages of at most this many tokens.
+
+    Returns:
+        The best sections in document order, separated by blank lines.
+        Empty string when no section shares a term with the query.
+    """
+    lines = split_long_lines(content.splitlines(), section_tokens)
+    sections = pack_windows(lines, section_tokens)
+    texts = ["\n".join(lines[start:end]).strip() for start, end in sections]
+    scores = BM25Index(texts).scores(query)
+
+    selected = []
+    budget = max_tokens
+    for index in sorted(range(len(texts)), key=lambda i: scores[i], reverse=True):
+        if scores[index] <= 0 or (top_k is not None and len(selected) >= top_k):
+            break
+        if budget is not None:
+            tokens = estimate_tokens(texts[index])
+            if tokens > budget:
+                continue
+            budget -= tokens
+        selected.append(index)
+
+    return "\n\n".join(texts[index] for index in sorted(selected))
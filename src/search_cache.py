@@ -0,0 +1,70 @@
+from cache import LRUCache
+from shared_task import SharedTask
+from metrics import CACHE_REQUESTS
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+class SearchCache:
+    """
+    Cache of search results keyed by normalized (query, locale), with single-flight deduplication.
+    An entry fetched with a larger count also answers requests for fewer results,
+    and concurrent identical queries share one upstream request, cancelled once none of them waits for it.
+    """
+    def __init__(self, max_entries: int = 1024, ttl: float = 600, min_fetch_count: int = 20):
+        """
+        Args:
+            max_entries: Number of cached queries kept before evicting the least recently used.
+            ttl: Seconds a result set is served from the cache.
+            min_fetch_count: Number of results requested upstream at least, so the entry can serve larger counts later.
+        """
+        self.entries = LRUCache(max_entries, ttl=ttl)
+        self.min_fetch_count = min_fetch_count
+        self.in_flight = {}
+
+    @staticmethod
+    def _covers(count: int, results: list, fetched_count: int) -> bool:
+        # A result set shorter than requested is exhaustive, it answers any count
+        return fetched_count >= count or len(results) < fetched_count
+
+    async def get_or_fetch(self, query: str, count: int, locale, fetch) -> list[dict[str, str]] | None:
+        """
+        Args:
+            query: The search query.
+            count: Number of results wanted.
+            locale: Hashable locale part of the key (e.g. country and language).
+            fetch: Coroutine function taking a count and returning the results, or None on error.
+
+        Returns:
+            Up to `count` results, or None when the upstream request failed.
+        """
+        key = (normalize_query(query), locale)
+        cached = self.entries.get(key)
+        if cached and self._covers(count, cached["results"], cached["count"]):
+            CACHE_REQUESTS.inc(cache="search", result="hit")
+            return cached["results"][:count]
+        
+        flight = self.in_flight.get(key)
+        if flight and flight["count"] >= count and flight["shared"].joinable:
+            CACHE_REQUESTS.inc(cache="search", result="shared")
+        else:
+            CACHE_REQUESTS.inc(cache="search", result="miss")
+            fetch_count = max(count, self.min_fetch_count)
+            flight = {"count": fetch_count, "shared": SharedTask(fetch(fetch_count))}
+            self.in_flight[key] = flight
+            flight["shared"].add_done_callback(lambda shared: self._finish(key, flight))
+        
+        results = await flight["shared"].join()
+        return results[:count] if results is not None else None
+
+    def _finish(self, key, flight: dict):
+        if self.in_flight.get(key) is flight:
+            del self.in_flight[key]
+        task = flight["shared"].task
+        if task.cancelled() or task.exception() is not None:
+            return
+        results = task.result()
+        if results is not None:
+            self.entries.set(key, {"count": flight["count"], "results": results})
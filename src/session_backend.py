@@ -0,0 +1,191 @@
+import json
+import time
+import asyncio
+
+try:
+    import redis.asyncio as redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+
+class SessionBackend:
+    """
+    Keeps track of the open sessions and routes messages to the worker holding a session's SSE stream.
+    This in-memory backend only knows about the sessions of its own process, so it suits a single worker.
+
+    The worker holding a stream subscribes to its session's messages, which are passed to `deliver`;
+    every worker can check a session, refresh its idle timer, publish messages to it and broadcast
+    control commands (e.g. closing a session) that are passed to `control` on all workers.
+    """
+    def __init__(self, idle_ttl: float = 3600):
+        """
+        Args:
+            idle_ttl: Sessions not touched for this many seconds are considered gone.
+        """
+        self.idle_ttl = idle_ttl
+        self.last_activity = {}
+        self.deliver = None
+        self.control = None
+
+    async def start(self, deliver, control):
+        """
+        Args:
+            deliver: Coroutine function `(session_id, message)` handing a message to a local session.
+            control: Coroutine function `(command)` applying a control command on this worker.
+        """
+        self.deliver = deliver
+        self.control = control
+
+    async def add_session(self, session_id: str):
+        self.last_activity[session_id] = time.monotonic()
+
+    async def touch_session(self, session_id: str) -> bool:
+        """
+        Refreshes the idle timer of a session.
+
+        Returns:
+            Whether the session exists.
+        """
+        if session_id not in await self.alive_sessions([session_id]):
+            return False
+        self.last_activity[session_id] = time.monotonic()
+        return True
+
+    async def alive_sessions(self, session_ids: list[str]) -> set[str]:
+        now = time.monotonic()
+        return {
+            session_id for session_id in session_ids
+            if now - self.last_activity.get(session_id, -self.idle_ttl - 1) <= self.idle_ttl
+        }
+
+    async def remove_session(self, session_id: str):
+        self.last_activity.pop(session_id, None)
+
+    async def prune(self):
+        """
+        Forgets the sessions that went idle, called periodically.
+        """
+        expired = self.last_activity.keys() - await self.alive_sessions(list(self.last_activity))
+        for session_id in expired:
+            del self.last_activity[session_id]
+
+    async def subscribe(self, session_id: str):
+        """
+        Starts receiving the messages published to a session, when this worker holds its stream.
+        """
+
+    async def unsubscribe(self, session_id: str):
+        pass
+
+    async def publish(self, session_id: str, message: dict):
+        if self.deliver:
+            await self.deliver(session_id, message)
+
+    async def publish_control(self, command: dict):
+        if self.control:
+            await self.control(command)
+
+    async def aclose(self):
+        pass
+
+
+class RedisSessionBackend(SessionBackend):
+    """
+    Session backend shared by several workers or replicas through Redis.
+    Sessions are keys expiring after the idle TTL, messages for a session are published on its own channel
+    (only the worker holding the stream subscribes to it) and control commands on a channel all workers listen to.
+    """
+    def __init__(self, url: str, idle_ttl: float = 3600, prefix: str = "mcp"):
+        """
+        Args:
+            url: Redis URL, e.g. `redis://localhost:6379/0`.
+            idle_ttl: Sessions not touched for this many seconds expire.
+            prefix: Prefix of the keys and channels, to share one Redis between deployments.
+        """
+        if not REDIS_AVAILABLE:
+            raise RuntimeError("The redis package is required for the Redis session backend")
+        super().__init__(idle_ttl)
+        self.redis = redis.from_url(url)
+        self.prefix = prefix
+        self.control_channel = f"{prefix}:control"
+        self.pubsub = None
+        self.reader = None
+        self.deliveries = set()
+
+    def _session_key(self, session_id: str) -> str:
+        return f"{self.prefix}:session:{session_id}"
+
+    def _session_channel(self, session_id: str) -> str:
+        return f"{self.prefix}:messages:{session_id}"
+
+    async def start(self, deliver, control):
+        await super().start(deliver, control)
+        self.pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        await self.pubsub.subscribe(self.control_channel)
+        self.reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        while True:
+            try:
+                message = await self.pubsub.get_message(timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Session backend connection error: {e}")
+                await asyncio.sleep(1)
+                continue
+            if not message or message["type"] != "message":
+                continue
+            
+            channel = message["channel"].decode()
+            data = json.loads(message["data"])
+            if channel == self.control_channel:
+                coroutine = self.control(data)
+            else:
+                coroutine = self.deliver(channel.rsplit(":", 1)[-1], data)
+            # Don't let a slow client hold up the messages of all other sessions
+            task = asyncio.create_task(coroutine)
+            self.deliveries.add(task)
+            task.add_done_callback(self.deliveries.discard)
+
+    async def add_session(self, session_id: str):
+        await self.redis.set(self._session_key(session_id), 1, ex=max(int(self.idle_ttl), 1))
+
+    async def touch_session(self, session_id: str) -> bool:
+        return bool(await self.redis.expire(self._session_key(session_id), max(int(self.idle_ttl), 1)))
+
+    async def alive_sessions(self, session_ids: list[str]) -> set[str]:
+        if not session_ids:
+            return set()
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for session_id in session_ids:
+                pipe.exists(self._session_key(session_id))
+            results = await pipe.execute()
+        return {session_id for session_id, exists in zip(session_ids, results) if exists}
+
+    async def remove_session(self, session_id: str):
+        await self.redis.delete(self._session_key(session_id))
+
+    async def prune(self):
+        # Keys expire on their own
+        pass
+
+    async def subscribe(self, session_id: str):
+        await self.pubsub.subscribe(self._session_channel(session_id))
+
+    async def unsubscribe(self, session_id: str):
+        await self.pubsub.unsubscribe(self._session_channel(session_id))
+
+    async def publish(self, session_id: str, message: dict):
+        await self.redis.publish(self._session_channel(session_id), json.dumps(message))
+
+    async def publish_control(self, command: dict):
+        await self.redis.publish(self.control_channel, json.dumps(command))
+
+    async def aclose(self):
+        if self.reader:
+            self.reader.cancel()
+        if self.pubsub:
+            await self.pubsub.aclose()
+        await self.redis.aclose()
@@ -0,0 +1,36 @@
+import asyncio
+
+
+class SharedTask:
+    """
+    A task whose result several callers wait for (single-flight deduplication).
+    Each caller is counted while it waits; when the last one is cancelled, the task is cancelled too,
+    so work nobody waits for anymore stops and frees its capacity.
+    """
+    def __init__(self, coroutine):
+        self.task = asyncio.create_task(coroutine)
+        self.waiters = 0
+        self.abandoned = False
+
+    @property
+    def joinable(self) -> bool:
+        """
+        Whether new callers can still wait for the result, abandoned tasks are being cancelled.
+        """
+        return not self.abandoned and not self.task.cancelled()
+
+    def add_done_callback(self, callback):
+        self.task.add_done_callback(lambda task: callback(self))
+
+    async def join(self):
+        """
+        Waits for the result. Cancelling the caller only cancels the task if no one else waits for it.
+        """
+        self.waiters += 1
+        try:
+            return await asyncio.shield(self.task)
+        finally:
+            self.waiters -= 1
+            if not self.waiters and not self.task.done():
+                self.abandoned = True
+                self.task.cancel()
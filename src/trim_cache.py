@@ -0,0 +1,39 @@
+import hashlib
+from cache import LRUCache, SqliteStore
+from search_cache import normalize_query
+
+
+class TrimCache:
+    """
+    Cache of context trim results keyed by (content hash, normalized context, model name).
+    Only the selected line ranges are stored, not the text, so entries stay tiny.
+    """
+    def __init__(self, max_entries: int = 4096, path: str|None = None, max_disk_bytes: int = 16 * 1024 * 1024):
+        """
+        Args:
+            max_entries: Number of results kept in memory before evicting the least recently used.
+            path: Optional SQLite database to persist results across restarts.
+            max_disk_bytes: Size bound of the persisted results.
+        """
+        self.memory = LRUCache(max_entries)
+        self.disk = SqliteStore(path, max_disk_bytes, table="trims") if path else None
+
+    @staticmethod
+    def key(content: str, context: str, model_name: str) -> str:
+        content_hash = hashlib.sha256(content.encode("utf-8", "surrogatepass")).hexdigest()
+        context_hash = hashlib.sha256(normalize_query(context).encode("utf-8", "surrogatepass")).hexdigest()
+        return f"{model_name}:{content_hash}:{context_hash}"
+
+    def get(self, key: str) -> list[tuple[int, int]] | None:
+        ranges = self.memory.get(key)
+        if ranges is None and self.disk:
+            ranges = self.disk.get(key)
+            if ranges is not None:
+                ranges = [tuple(line_range) for line_range in ranges]
+                self.memory.set(key, ranges)
+        return ranges
+
+    def set(self, key: str, ranges: list[tuple[int, int]]):
+        self.memory.set(key, ranges)
+        if self.disk:
+            self.disk.set(key, ranges)